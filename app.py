@@ -4,15 +4,37 @@ Test and modify AI prompts for the Knowledge Core IQ Search application
 """
 
 import streamlit as st
-import requests
-import json
 from prompts import CATEGORY_PROMPTS
+from openrouter import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_TIMEOUT,
+    MODELS,
+    OpenRouterClient,
+    describe_error,
+    format_prompt,
+)
+from response_cache import ResponseCache
+from scheduler import Scheduler
+from coalesce import SingleFlight
+from research import Researcher
+from run_store import RunStore
+from token_limits import AdaptiveLimits
+from hedging import HedgePolicy
+from telemetry import MAX_SAMPLES, CallSummary, TelemetryStore, percentile
+import batch
+import compare
+import dossier
+import evaluation
+from jobs import CANCELLED, DONE, FAILED, QUEUED, JobManager
+import io
+import time
 import os
+import tempfile
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-env_path = os.path.join(os.path.dirname(__file__), '.env')
-load_dotenv(dotenv_path=env_path)
+# Time of this script run, for the rerun timings on the Telemetry page
+run_started = time.perf_counter()
 
 # Page configuration
 st.set_page_config(
@@ -21,6 +43,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+
+@st.cache_resource(show_spinner=False)
+def load_config():
+    """Read the .env file once per server process rather than on every rerun."""
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+    return {"api_key": os.getenv("OPENROUTER_API_KEY", "")}
+
+
+config = load_config()
+
 # Custom CSS
 st.markdown("""
     <style>
@@ -64,6 +96,13 @@ st.markdown('<p class="sub-header">Test and modify AI prompts for KC ProspectIQ
 # Sidebar configuration
 st.sidebar.header("⚙️ Configuration")
 
+mode = st.sidebar.radio(
+    "Mode",
+    ["Single Prompt", "Dossier", "Compare Models", "Evaluate", "Batch (CSV)", "Telemetry"],
+    horizontal=True,
+    help="Research one prospect interactively or run a CSV of prospects in bulk"
+)
+
 st.sidebar.subheader("📋 Input Data")
 first_name = st.sidebar.text_input("First Name", placeholder="e.g., John", key="first_name")
 last_name = st.sidebar.text_input("Last Name", placeholder="e.g., Smith", key="last_name")
@@ -87,49 +126,643 @@ st.sidebar.markdown("---")
 
 model = st.sidebar.selectbox(
     "AI Model",
-    [
-        "google/gemini-2.5-flash",
-        "google/gemini-2.0-flash-001",
-        "google/gemini-3-pro-preview",
-        "google/gemini-2.5-pro",
-        "openai/gpt-4.1-mini",
-        "openai/gpt-5-mini",
-        "openai/gpt-4o-mini",
-        "openai/gpt-5",
-        "openai/gpt-4.1",
-        "x-ai/grok-code-fast-1",
-    ],
+    MODELS,
     index=0,
     help="Select the AI model to use"
 )
 
+stream_response = st.sidebar.checkbox(
+    "Stream response",
+    value=True,
+    help="Render tokens as they arrive instead of waiting for the full answer"
+)
+
+bypass_cache = st.sidebar.checkbox(
+    "Bypass response cache",
+    value=False,
+    help="Always call the API and refresh the cached answer for this prompt"
+)
+
+adaptive_max_tokens = st.sidebar.checkbox(
+    "Adaptive max tokens",
+    value=True,
+    help="Size the completion limit from past answers for this category and model "
+         f"(instead of a flat {DEFAULT_MAX_TOKENS}) and retry answers that get cut off"
+)
+
+hedge_requests = st.sidebar.checkbox(
+    "Hedge slow requests",
+    value=False,
+    help="If the model has not started answering within its recent p95 time to first token, "
+         "also ask its fallback model and keep whichever answers first"
+)
+
+with st.sidebar.expander("Request timeouts"):
+    connect_timeout = st.number_input(
+        "Connect timeout (s)", min_value=1.0, max_value=60.0, value=DEFAULT_CONNECT_TIMEOUT, step=1.0
+    )
+    read_timeout = st.number_input(
+        "Read timeout (s)", min_value=5.0, max_value=600.0, value=DEFAULT_TIMEOUT, step=5.0
+    )
+
 # Get API key from environment
-api_key = os.getenv("OPENROUTER_API_KEY", "")
+api_key = config["api_key"]
 
-# Main layout - Edit Prompt on left, Response on right
-col1, col2 = st.columns([1, 1], gap="medium")
 
-with col1:
+@st.cache_resource
+def get_telemetry():
+    """Append-only call log shared by every session."""
+    return TelemetryStore()
+
+
+@st.cache_resource
+def get_call_summary():
+    """Dashboard totals kept up to date from the telemetry log."""
+    return CallSummary(get_telemetry())
+
+
+@st.cache_resource
+def get_scheduler():
+    """Rate-limit budgets and request queue shared by every session."""
+    return Scheduler()
+
+
+@st.cache_resource
+def get_client(api_key):
+    """One pooled, retrying OpenRouter client per server process."""
+    return OpenRouterClient(api_key, telemetry=get_telemetry(), scheduler=get_scheduler())
+
+
+@st.cache_resource
+def get_response_cache():
+    """One SQLite-backed response cache shared by every session."""
+    return ResponseCache()
+
+
+response_cache = get_response_cache()
+
+
+@st.cache_resource
+def get_job_manager():
+    """Background executor and job table shared by every session."""
+    return JobManager()
+
+
+job_manager = get_job_manager()
+
+
+@st.cache_resource
+def get_flights():
+    """In-flight generations shared by every session, so identical requests are only paid for once."""
+    return SingleFlight()
+
+
+flights = get_flights()
+
+
+@st.cache_resource
+def get_token_limits():
+    """max_tokens per category and model, learned from the telemetry log."""
+    return AdaptiveLimits(get_telemetry())
+
+
+@st.cache_resource
+def get_hedge_policy():
+    """Fallback models and hedge thresholds, learned from the telemetry log."""
+    return HedgePolicy(get_telemetry())
+
+
+@st.cache_resource
+def get_researcher(api_key):
+    """Headless research API over the shared client, response cache and in-flight table."""
+    return Researcher(get_client(api_key), cache=response_cache, flights=flights, limits=get_token_limits(),
+                      hedging=get_hedge_policy())
+
+
+# Seconds between refreshes of panels that show running jobs
+JOB_POLL_INTERVAL = 0.5
+MAX_KEPT_JOBS = 10
+MAX_RUN_TIMINGS = 200
+
+
+def record_run_time(scope="app", started=None):
+    """Keep how long this run (or fragment rerun) of the script took, for the Telemetry page."""
+    timings = st.session_state.setdefault("run_timings", [])
+    timings.append((scope, time.perf_counter() - (started or run_started)))
+    del timings[:-MAX_RUN_TIMINGS]
+
+
+def render_queue_status():
+    """Sidebar panel with the shared request queue, refreshed while anything is waiting or running."""
+    stats = get_scheduler().stats()
+    counts = job_manager.counts()
+    st.subheader("🚦 Request Queue")
+    col1, col2 = st.columns(2)
+    col1.metric("Waiting for budget", stats["waiting"],
+                help=f"{stats['waiting_bulk']} of them are batch requests")
+    col2.metric("Running jobs", counts["running"])
+    st.caption(f"Rate-limit wait, last 5 min: avg {stats['avg_wait']:.2f}s · max {stats['max_wait']:.2f}s")
+    shared = flights.stats()
+    st.caption(f"🔗 {shared['saved']} calls saved by sharing identical in-flight requests "
+               f"({shared['leaders']} sent)")
+
+
+with st.sidebar:
+    st.markdown("---")
+    queue_busy = get_scheduler().stats()["waiting"] or job_manager.counts()["running"]
+    st.fragment(render_queue_status, run_every=2 if queue_busy else None)()
+
+
+def live(render, jobs):
+    """Draw `render()` as a fragment that refreshes itself while any of `jobs` is still running."""
+    active = any(job.active for job in jobs)
+
+    def refresh():
+        render()
+        # Once everything has finished, one full rerun stops the polling
+        if active and not any(job.active for job in jobs):
+            st.rerun()
+
+    st.fragment(refresh, run_every=JOB_POLL_INTERVAL if active else None)()
+
+
+def show_error(message):
+    st.markdown('<div class="error-section">', unsafe_allow_html=True)
+    st.error(f"❌ {message}")
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+def completion_caption(completion):
+    if completion.cached:
+        return "⚡ Cache hit: served from the local response cache"
+    if completion.coalesced:
+        return (f"🔗 Shared: joined an identical request already in flight · "
+                f"waited {completion.latency:.2f}s")
+    timing = f"total {completion.latency:.2f}s"
+    if completion.hedged:
+        timing = f"hedged, answered by {completion.model} · {timing}"
+    if completion.ttft is not None:
+        timing = f"first token {completion.ttft:.2f}s · {timing}"
+    if completion.queue_wait >= 0.05:
+        timing = f"queued {completion.queue_wait:.2f}s · {timing}"
+    if completion.attempts > 1:
+        timing += f" · {completion.attempts - 1} retries"
+    if completion.max_tokens:
+        timing += f" · max_tokens {completion.max_tokens}"
+        if completion.finish_reason == "length":
+            timing += " (answer cut off)"
+    prompt_tokens = completion.usage.get("prompt_tokens")
+    if prompt_tokens:
+        timing += f" · input tokens {completion.cached_tokens}/{prompt_tokens} cached"
+    return f"🌐 Cache miss: {timing}"
+
+
+def cancel_button(job):
+    if job.active:
+        st.button("⏹️ Cancel", key=f"cancel_{job.id}", on_click=job_manager.cancel, args=(job.id,),
+                  disabled=job.cancel_requested)
+
+
+def render_job(job, caption=True):
+    """Status, (partial) output and errors of one generation job."""
+    if job.status == QUEUED:
+        st.info("⏳ Queued...")
+    elif job.active:
+        st.caption(f"🤖 Generating AI response... {job.elapsed:.1f}s")
+    elif job.status == DONE and caption:
+        st.caption(completion_caption(job.result))
+
+    text = job.result.text if job.status == DONE else job.text
+    if text:
+        st.markdown('<div class="response-section">', unsafe_allow_html=True)
+        st.markdown(text)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+    if job.status == FAILED:
+        show_error(describe_error(job.error))
+    elif job.status == CANCELLED:
+        st.warning(f"⏹️ Cancelled after {job.elapsed:.1f}s")
+    cancel_button(job)
+
+
+def submit_generation(researcher, model, prompt, label, category, extra_options=None):
+    """Queue one generation on the background executor and return its job id."""
+    options = dict(
+        bypass_cache=bypass_cache, connect_timeout=connect_timeout, read_timeout=read_timeout,
+        category=category, max_tokens=None if adaptive_max_tokens else DEFAULT_MAX_TOKENS,
+        hedge=hedge_requests
+    )
+    options.update(extra_options or {})
+    queued_at = time.perf_counter()
+
+    def work(job):
+        return researcher.complete(
+            model, prompt, stream=stream_response, on_text=job.on_text, queued_at=queued_at,
+            cancel=job.cancel_scope, **options
+        )
+
+    return job_manager.submit(work, label, model=model, category=category)
+
+
+def render_batch_page():
+    """Bulk mode: run a CSV of prospects against the selected categories."""
+    st.header("Batch Run")
+    st.caption("Upload a CSV with first_name, last_name, city, state columns. "
+               "Edited prompts from Single Prompt mode are used for their categories.")
+
+    uploaded = st.file_uploader("Prospects CSV", type=["csv"])
+    categories = st.multiselect("Categories", list(CATEGORY_PROMPTS.keys()), default=list(CATEGORY_PROMPTS.keys()))
+
+    resumable = st.checkbox(
+        "Resumable run",
+        value=False,
+        help="Write results to rotating chunks in a run directory with a checkpoint index; "
+             "re-running into the same directory skips everything already completed"
+    )
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        concurrency = st.number_input("Concurrent requests", min_value=1, max_value=64,
+                                      value=batch.DEFAULT_CONCURRENCY)
+    with col2:
+        if resumable:
+            output_path = st.text_input("Run directory", value=os.path.join(tempfile.gettempdir(), "kc_batch_run"))
+        else:
+            output_path = st.text_input("Results file (JSONL)",
+                                        value=os.path.join(tempfile.gettempdir(), "kc_batch_results.jsonl"))
+
+    run_btn = st.button("Run Batch", type="primary", disabled=not (uploaded and categories))
+    if run_btn:
+        if not api_key:
+            st.error("❌ API key not found in environment variables.")
+            return
+        client = get_client(api_key)
+        templates = {c: st.session_state.get(f"prompt_{c}", CATEGORY_PROMPTS[c]) for c in categories}
+        csv_bytes = uploaded.getvalue()
+        options = dict(categories=categories, templates=templates, concurrency=int(concurrency),
+                       cache=response_cache, bypass_cache=bypass_cache, flights=flights,
+                       max_tokens=None if adaptive_max_tokens else DEFAULT_MAX_TOKENS, limits=get_token_limits())
+
+        def work(job):
+            def show_progress(record, summary):
+                job.meta["summary"] = dict(summary)
+                job.text = (f"Last: {record['first_name']} {record['last_name']} — "
+                            f"{record['category']} ({record['status']})")
+                job.check_cancelled()
+
+            output = RunStore(output_path) if resumable else output_path
+            try:
+                return batch.run_batch(
+                    batch.read_prospects(batch.open_uploaded_csv(io.BytesIO(csv_bytes))), client, model,
+                    output, on_result=show_progress, cancel=job.cancel_scope, **options
+                )
+            finally:
+                if resumable:
+                    output.close()
+
+        st.session_state["batch_job"] = job_manager.submit(work, f"Batch: {uploaded.name}", output=output_path)
+
+    jobs = job_manager.jobs([st.session_state.get("batch_job")])
+    if not jobs:
+        return
+    job = jobs[0]
+
+    def draw():
+        summary = job.result if job.status == DONE else job.meta.get("summary")
+        if summary:
+            st.markdown(
+                f"**{summary['completed']}** completed · ✅ {summary['succeeded']} · "
+                f"❌ {summary['failed']} · ⏭️ {summary['skipped']} already done · "
+                f"{summary['elapsed']:.1f}s elapsed"
+            )
+        elif job.active:
+            st.info("⏳ Starting batch...")
+        if job.active and job.text:
+            st.caption(job.text)
+        if job.status == DONE:
+            st.success(f"Finished {summary['completed']} requests in {summary['elapsed']:.1f}s. "
+                       f"Results are in {job.meta['output']}")
+        elif job.status == FAILED:
+            show_error(describe_error(job.error))
+        elif job.status == CANCELLED:
+            st.warning(f"⏹️ Batch cancelled; results so far are in {job.meta['output']}")
+        cancel_button(job)
+
+    live(draw, jobs)
+
+
+def render_compare_page():
+    """Comparison mode: race the current prompt across several models side by side."""
+    st.header("Compare Models")
+    template = st.session_state.get(f"prompt_{selected_category}", CATEGORY_PROMPTS[selected_category])
+    st.caption(f"Sends the **{selected_category}** prompt (including unsaved edits) "
+               "for the prospect in the sidebar to every selected model at once.")
+
+    models = st.multiselect("Models", MODELS, default=[model])
+    run_btn = st.button("Run Comparison", type="primary", disabled=not models)
+    if run_btn:
+        if not api_key:
+            st.error("❌ API key not found in environment variables.")
+            return
+        if not full_name or not city or not state:
+            st.error("❌ Please fill in all required fields: First Name, Last Name, City, and State.")
+            return
+        try:
+            formatted_prompt = format_prompt(template, full_name, city, state)
+        except KeyError as e:
+            st.error(f"❌ Prompt formatting error: Missing variable {e}. Use {{full_name}}, {{city}}, {{state}}.")
+            return
+        researcher = get_researcher(api_key)
+        st.session_state["compare_jobs"] = {
+            name: submit_generation(researcher, name, formatted_prompt, f"{name} · {selected_category}",
+                                    selected_category, {"hedge": False})
+            for name in models
+        }
+
+    job_ids = st.session_state.get("compare_jobs", {})
+    jobs = dict(zip(job_ids, job_manager.jobs(job_ids.values())))
+    if not jobs:
+        return
+
+    def draw():
+        rows = [
+            compare.summary_row(name, job.result, describe_error(job.error) if job.error else job.status,
+                                elapsed=job.elapsed)
+            for name, job in jobs.items() if not job.active
+        ]
+        if rows:
+            st.dataframe(sorted(rows, key=lambda r: r["Latency (s)"] or 0), use_container_width=True,
+                         hide_index=True)
+        per_row = 3
+        names = list(jobs)
+        for start in range(0, len(names), per_row):
+            columns = st.columns(per_row, gap="medium")
+            for column, name in zip(columns, names[start:start + per_row]):
+                with column:
+                    st.subheader(name)
+                    render_job(jobs[name])
+
+    live(draw, list(jobs.values()))
+
+
+def render_run_timings():
+    """How long this session's page runs and editor reruns took to execute."""
+    timings = {}
+    for scope, seconds in st.session_state.get("run_timings", []):
+        timings.setdefault(scope, []).append(seconds * 1000)
+    if not timings:
+        return
+    cols = st.columns(len(timings))
+    for col, (scope, values) in zip(cols, sorted(timings.items())):
+        label = "Page run" if scope == "app" else f"{scope.capitalize()} rerun"
+        col.metric(f"{label}, p50", f"{percentile(values, 50):.1f} ms",
+                   help=f"p95 {percentile(values, 95):.1f} ms over the last {len(values)} runs in this session")
+
+
+def render_telemetry_page():
+    """Latency and token dashboard built from the telemetry log."""
+    st.header("Telemetry")
+    render_run_timings()
+    windows = {"Last hour": 3600, "Last 24 hours": 86400, "Last 7 days": 7 * 86400, "All time": None}
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        window = st.selectbox("Time window", list(windows.keys()), index=1)
+    with col2:
+        group_by = st.selectbox("Group by", ["Model and category", "Model", "Category"])
+
+    seconds = windows[window]
+    calls = get_call_summary()
+    if not calls.poll(timeout=1):
+        with st.spinner("Reading the telemetry log..."):
+            calls.poll(timeout=60)
+    since = time.time() - seconds if seconds else None
+    total = calls.total(since)
+    if not total.calls:
+        st.info("No calls recorded in this window yet.")
+        return
+
+    by = {"Model and category": ("model", "category"), "Model": ("model",), "Category": ("category",)}[group_by]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Calls", total.calls)
+    col2.metric("Errors", total.errors)
+    col3.metric("Cancelled", total.cancelled)
+    col4.metric("Prompt + completion tokens", total.tokens)
+    st.dataframe(calls.rows(since, by=by), use_container_width=True, hide_index=True)
+    st.caption(f"Read from {get_telemetry().path}. Windows are rounded to {calls.bucket // 60}-minute slices, "
+               f"and latency percentiles sample up to {MAX_SAMPLES:,} calls per slice.")
+
+    budgets = get_scheduler().budgets()
+    if budgets:
+        st.subheader("Rate-limit budgets")
+        st.caption("Shared by every session in this server process; override with KC_RATE_LIMITS.")
+        st.dataframe(budgets, use_container_width=True, hide_index=True)
+
+    limits = get_token_limits()
+    st.subheader("Adaptive max_tokens")
+    st.caption(f"p{limits.percentile:g} of completion tokens × {limits.headroom:g} headroom once a category "
+               f"and model has {limits.min_samples} answers in the last {limits.window // 86400} days "
+               f"(otherwise {limits.default}); truncated answers are retried with a larger limit.")
+    st.dataframe(limits.rows(), use_container_width=True, hide_index=True)
+
+    hedging = get_hedge_policy().stats()
+    if hedging:
+        st.subheader("Hedged requests")
+        st.caption("Since this server started. A request is hedged when the model's first token takes longer "
+                   "than the threshold (its recent p95 once enough streamed answers are logged).")
+        st.dataframe(hedging, use_container_width=True, hide_index=True)
+
+
+def render_dossier_page():
+    """Dossier mode: every category for the current prospect, dispatched concurrently."""
+    st.header("Prospect Dossier")
+    st.caption("Runs all categories (including unsaved prompt edits) for the prospect in the sidebar.")
+    combined = st.checkbox(
+        "Send as one combined request",
+        value=False,
+        help="Ask for all sections in a single call instead of one call per category, to compare wall-clock time"
+    )
+    run_btn = st.button("Build Dossier", type="primary")
+    if run_btn:
+        if not api_key:
+            st.error("❌ API key not found in environment variables.")
+            return
+        if not full_name or not city or not state:
+            st.error("❌ Please fill in all required fields: First Name, Last Name, City, and State.")
+            return
+
+        templates = {c: st.session_state.get(f"prompt_{c}", CATEGORY_PROMPTS[c]) for c in CATEGORY_PROMPTS}
+        researcher = get_researcher(api_key)
+        try:
+            calls = dossier.dossier_requests(full_name, city, state, templates, combined)
+        except KeyError as e:
+            st.error(f"❌ Prompt formatting error: Missing variable {e}. Use {{full_name}}, {{city}}, {{state}}.")
+            return
+        job_ids = {
+            key: submit_generation(researcher, model, prompt, f"{full_name} · {category}", category,
+                                   {"max_tokens": max_tokens} if max_tokens else None)
+            for key, (category, prompt, max_tokens) in calls.items()
+        }
+        st.session_state["dossier_jobs"] = job_ids
+
+    job_ids = st.session_state.get("dossier_jobs", {})
+    jobs = dict(zip(job_ids, job_manager.jobs(job_ids.values())))
+    if not jobs:
+        return
+    categories = list(CATEGORY_PROMPTS)
+
+    def draw():
+        finished = [job for job in jobs.values() if not job.active]
+        started = min((job.started_at for job in jobs.values() if job.started_at), default=None)
+        wall = (max(job.finished_at for job in finished) - started) if finished and started else 0.0
+        if "combined" in jobs:
+            job = jobs["combined"]
+            st.progress(1.0 if finished else 0.0, text=f"One combined request · {job.elapsed:.2f}s")
+            sections = dossier.split_combined_response(job.result.text, categories) if job.status == DONE else {}
+            if job.status != DONE:
+                render_job(job)
+        else:
+            total = sum(job.result.latency for job in finished if job.status == DONE)
+            st.progress(len(finished) / len(jobs),
+                        text=f"{len(finished)}/{len(jobs)} categories · {wall:.2f}s wall clock "
+                             f"(sum of individual latencies {total:.2f}s)")
+        for category, tab in zip(categories, st.tabs(categories)):
+            with tab:
+                if "combined" not in jobs:
+                    if category in jobs:
+                        render_job(jobs[category])
+                elif category in sections:
+                    st.markdown(sections[category])
+                elif jobs["combined"].status == DONE:
+                    show_error("Section missing from the combined response")
+                else:
+                    st.info("⏳ Waiting for response...")
+
+    live(draw, list(jobs.values()))
+
+
+def render_evaluation_page():
+    """Evaluation mode: score the edited prompt against the default one on a fixed prospect set."""
+    st.header("Evaluate Prompt")
+    edited = st.session_state.get(f"prompt_{selected_category}", CATEGORY_PROMPTS[selected_category])
+    st.caption(f"Runs the **{selected_category}** prompt as edited in Single Prompt mode and its default "
+               "over a fixed set of prospects, and checks every answer for three • bullets, one paragraph "
+               f"of {evaluation.MIN_WORDS}-{evaluation.MAX_WORDS} words, no research/reasoning leakage and "
+               "mentions of the prospect's name and city. Samples bypass the response cache.")
+    if edited == CATEGORY_PROMPTS[selected_category]:
+        st.info("The prompt has not been edited, so only the default variant will run.")
+
+    models = st.multiselect("Models", MODELS, default=[model], key="eval_models")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        prospect_count = st.number_input("Prospects", min_value=1, max_value=len(evaluation.EVAL_PROSPECTS),
+                                         value=4)
+    with col2:
+        samples = st.number_input("Samples per prospect", min_value=1, max_value=20,
+                                  value=evaluation.DEFAULT_SAMPLES)
+    with col3:
+        concurrency = st.number_input("Concurrent requests", min_value=1, max_value=64,
+                                      value=evaluation.DEFAULT_CONCURRENCY, key="eval_concurrency")
+
+    run_btn = st.button("Run Evaluation", type="primary", disabled=not models)
+    if run_btn:
+        if not api_key:
+            st.error("❌ API key not found in environment variables.")
+            return
+        variants = {"Default": CATEGORY_PROMPTS[selected_category]}
+        if edited != variants["Default"]:
+            variants["Edited"] = edited
+        client = get_client(api_key)
+        options = dict(models=models, prospects=evaluation.EVAL_PROSPECTS[:int(prospect_count)],
+                       samples=int(samples), category=selected_category, concurrency=int(concurrency))
+
+        def work(job):
+            def show_progress(record, done, total):
+                job.text = f"{done}/{total} answers generated"
+                job.check_cancelled()
+
+            return evaluation.run_evaluation(client, variants, on_result=show_progress,
+                                             cancel=job.cancel_scope, **options)
+
+        st.session_state["eval_job"] = job_manager.submit(work, f"Evaluate: {selected_category}")
+
+    jobs = job_manager.jobs([st.session_state.get("eval_job")])
+    if not jobs:
+        return
+    job = jobs[0]
+
+    def draw():
+        if job.active:
+            st.info(f"⏳ {job.text or 'Starting evaluation...'} · {job.elapsed:.1f}s")
+        elif job.status == DONE:
+            st.dataframe(evaluation.summarize_evaluation(job.result), use_container_width=True, hide_index=True)
+            st.caption(f"Pass rate counts answers that meet every check; intervals are 95% Wilson intervals. "
+                       f"{len(job.result)} answers in {job.elapsed:.1f}s.")
+            failures = [r for r in job.result if r["checks"] is not None and not r["passed"]]
+            if failures:
+                with st.expander(f"Failing answers ({len(failures)})"):
+                    for record in failures[:20]:
+                        missed = [c for c, ok in zip(evaluation.CHECKS, record["checks"]) if not ok]
+                        st.markdown(f"**{record['variant']} · {record['model']} · "
+                                    f"{record['prospect'].full_name}** — fails: {', '.join(missed)}")
+                        st.text(record["text"])
+        elif job.status == FAILED:
+            show_error(describe_error(job.error))
+        elif job.status == CANCELLED:
+            st.warning(f"⏹️ Evaluation cancelled after {job.elapsed:.1f}s")
+        cancel_button(job)
+
+    live(draw, [job])
+
+
+PAGES = {
+    "Batch (CSV)": render_batch_page,
+    "Telemetry": render_telemetry_page,
+    "Dossier": render_dossier_page,
+    "Compare Models": render_compare_page,
+    "Evaluate": render_evaluation_page,
+}
+if mode in PAGES:
+    PAGES[mode]()
+    record_run_time()
+    st.stop()
+
+
+def reset_prompt(category):
+    st.session_state[f"prompt_{category}"] = CATEGORY_PROMPTS[category]
+    st.session_state[f"prompt_textarea_{category}"] = CATEGORY_PROMPTS[category]
+
+
+def render_editor(category):
+    """
+    Prompt editor. Runs as a fragment, so committing an edit reruns only the
+    editor instead of the whole page.
+    """
+    started = time.perf_counter()
     st.header("Edit Prompt")
-    
-    # Get the current prompt
-    current_prompt = CATEGORY_PROMPTS[selected_category]
-    
-    # Initialize session state for the prompt if not exists
-    if f"prompt_{selected_category}" not in st.session_state:
-        st.session_state[f"prompt_{selected_category}"] = current_prompt
-    
+
+    # The edited prompt outlives the text area, which Streamlit forgets when it is not shown
+    if f"prompt_{category}" not in st.session_state:
+        st.session_state[f"prompt_{category}"] = CATEGORY_PROMPTS[category]
+    if f"prompt_textarea_{category}" not in st.session_state:
+        st.session_state[f"prompt_textarea_{category}"] = st.session_state[f"prompt_{category}"]
+
     # Editable prompt area
     edited_prompt = st.text_area(
         "Prompt Template",
-        value=st.session_state[f"prompt_{selected_category}"],
         height=400,
-        key=f"prompt_textarea_{selected_category}",
-        help="Edit the prompt template. Use {full_name}, {city}, {state} as variables."
+        key=f"prompt_textarea_{category}",
+        help="Edit the prompt template. Use {full_name}, {city}, {state} as variables. "
+             "Paragraphs using those variables are sent after the rest, which is sent as a "
+             "cacheable system prefix."
     )
-    
-    # Update session state with edited prompt
-    st.session_state[f"prompt_{selected_category}"] = edited_prompt
+    st.session_state[f"prompt_{category}"] = edited_prompt
+    record_run_time("editor", started)
+
+
+# Main layout - Edit Prompt on left, Response on right
+col1, col2 = st.columns([1, 1], gap="medium")
+
+with col1:
+    st.fragment(render_editor)(selected_category)
 
 with col2:
     st.header(f"{model} Response")
@@ -144,12 +777,7 @@ with col1:
     generate_btn = st.button("Generate Response", type="primary", use_container_width=True)
 
 with col2:
-    reset_btn = st.button("Reset to Default", use_container_width=True)
-
-# Handle reset button
-if reset_btn:
-    st.session_state[f"prompt_{selected_category}"] = CATEGORY_PROMPTS[selected_category]
-    st.rerun()
+    st.button("Reset to Default", use_container_width=True, on_click=reset_prompt, args=(selected_category,))
 
 # Handle generate button
 if generate_btn:
@@ -161,69 +789,42 @@ if generate_btn:
     else:
         # Format the prompt with user input
         try:
-            formatted_prompt = edited_prompt.format(
-                full_name=full_name,
-                city=city,
-                state=state
-            )
-            
-            # Call the OpenRouter API
-            with st.spinner("🤖 Generating AI response..."):
-                try:
-                    response = requests.post(
-                        "https://openrouter.ai/api/v1/chat/completions",
-                        headers={
-                            "Authorization": f"Bearer {api_key}",
-                            "HTTP-Referer": "https://localhost:3000",
-                            "X-Title": "KC ProspectIQ Prompt Tester",
-                        },
-                        json={
-                            "model": model,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": formatted_prompt
-                                }
-                            ],
-                            "temperature": 0.7,
-                            "max_tokens": 2048,
-                        },
-                        timeout=60
-                    )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        ai_response = data['choices'][0]['message']['content']
-                        
-                        # Display the response in the right column
-                        with response_container:
-                            st.markdown('<div class="response-section">', unsafe_allow_html=True)
-                            st.markdown(ai_response)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                    
-                    else:
-                        error_data = response.json()
-                        error_msg = error_data.get('error', {}).get('message', 'Unknown error')
-                        with response_container:
-                            st.markdown('<div class="error-section">', unsafe_allow_html=True)
-                            st.error(f"❌ API Error: {error_msg}")
-                            st.markdown('</div>', unsafe_allow_html=True)
-                
-                except requests.exceptions.Timeout:
-                    with response_container:
-                        st.markdown('<div class="error-section">', unsafe_allow_html=True)
-                        st.error("❌ Request timeout. The API took too long to respond.")
-                        st.markdown('</div>', unsafe_allow_html=True)
-                except requests.exceptions.RequestException as e:
-                    with response_container:
-                        st.markdown('<div class="error-section">', unsafe_allow_html=True)
-                        st.error(f"❌ Request failed: {str(e)}")
-                        st.markdown('</div>', unsafe_allow_html=True)
-        
+            formatted_prompt = format_prompt(st.session_state[f"prompt_{selected_category}"], full_name, city, state)
         except KeyError as e:
             with response_container:
                 st.markdown('<div class="error-section">', unsafe_allow_html=True)
                 st.error(f"❌ Prompt formatting error: Missing variable {e}. Use {{full_name}}, {{city}}, {{state}}.")
                 st.markdown('</div>', unsafe_allow_html=True)
+        else:
+            # Generate in the background so reruns don't block on (or discard) the call
+            job_id = submit_generation(
+                get_researcher(api_key), model, formatted_prompt,
+                f"{model} · {selected_category} · {full_name}", selected_category
+            )
+            st.session_state["single_jobs"] = [job_id] + st.session_state.get("single_jobs", [])[:MAX_KEPT_JOBS - 1]
+
+# Display this session's responses in the right column; they survive reruns
+single_jobs = job_manager.jobs(st.session_state.get("single_jobs", []))
+if single_jobs:
+    # Only the newest response and any still running are redrawn while polling;
+    # finished earlier ones are drawn once per page run from their stored text
+    latest, previous = single_jobs[0], single_jobs[1:]
+    running = [job for job in previous if job.active]
+    finished = [job for job in previous if not job.active]
+
+    def draw_single_jobs():
+        st.caption(latest.label)
+        render_job(latest)
+        for job in running:
+            st.markdown(f"**{job.label}**")
+            render_job(job)
 
+    with response_container:
+        live(draw_single_jobs, [latest] + running)
+        if finished:
+            with st.expander(f"Previous responses ({len(finished)})"):
+                for job in finished:
+                    st.markdown(f"**{job.label}**")
+                    render_job(job)
 
+record_run_time()
@@ -0,0 +1,240 @@
+"""
+Bulk prospect mode
+Reads a CSV of prospects and runs every selected category prompt against OpenRouter
+with a bounded number of concurrent requests, appending each result to a JSONL file
+as soon as it finishes
+
+CSV columns: first_name, last_name, city, state (header names are case-insensitive)
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from generation import complete
+from openrouter import (
+    DEFAULT_MAX_TOKENS,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_TEMPERATURE,
+    MODELS,
+    OpenRouterClient,
+    OpenRouterError,
+    describe_error,
+    format_prompt,
+)
+from prompts import CATEGORY_PROMPTS
+from response_cache import ResponseCache
+from run_store import RunStore, task_key
+from scheduler import BULK, Scheduler
+from telemetry import TelemetryStore
+from token_limits import AdaptiveLimits
+
+REQUIRED_COLUMNS = ("first_name", "last_name", "city", "state")
+DEFAULT_CONCURRENCY = 8
+
+
+def read_prospects(source):
+    """
+    Yield prospect dicts from a CSV path or text stream.
+
+    Rows are read lazily so arbitrarily large files never sit in memory.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8-sig") as f:
+            yield from read_prospects(f)
+        return
+
+    reader = csv.DictReader(source)
+    columns = {(name or "").strip().lower().replace(" ", "_"): name for name in reader.fieldnames or []}
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+    for row in reader:
+        prospect = {c: (row.get(columns[c]) or "").strip() for c in REQUIRED_COLUMNS}
+        if not any(prospect.values()):
+            continue
+        prospect["full_name"] = f"{prospect['first_name']} {prospect['last_name']}".strip()
+        yield prospect
+
+
+def iter_tasks(prospects, categories):
+    for prospect in prospects:
+        for category in categories:
+            yield prospect, category
+
+
+def run_one(prospect, category, template, client, model, temperature, max_tokens,
+            cache=None, bypass_cache=False, queued_at=None, flights=None, limits=None, cancel=None):
+    """
+    Run one prospect/category pair and return a JSON-serialisable result record.
+
+    Cancelling the CancelScope `cancel` aborts the call and raises the scope's error.
+    """
+    record = {
+        "first_name": prospect["first_name"],
+        "last_name": prospect["last_name"],
+        "city": prospect["city"],
+        "state": prospect["state"],
+        "category": category,
+        "model": model,
+    }
+    start = time.perf_counter()
+    try:
+        prompt = format_prompt(template, prospect["full_name"], prospect["city"], prospect["state"])
+        completion = complete(
+            client, model, prompt, temperature, max_tokens, cache=cache, bypass_cache=bypass_cache,
+            category=category, queued_at=queued_at, priority=BULK, flights=flights, limits=limits,
+            cancel=cancel
+        )
+        record.update(status="ok", response=completion.text, usage=completion.usage, cached=completion.cached)
+    except OpenRouterError as e:
+        record.update(status="error", error=describe_error(e), status_code=e.status_code)
+    except (KeyError, requests.exceptions.RequestException) as e:
+        record.update(status="error", error=describe_error(e))
+    record["latency"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(prospects, client, model, output, categories=None, templates=None,
+              concurrency=DEFAULT_CONCURRENCY, temperature=DEFAULT_TEMPERATURE,
+              max_tokens=DEFAULT_MAX_TOKENS, cache=None, bypass_cache=False,
+              on_result=None, flights=None, limits=None, cancel=None):
+    """
+    Run every prospect x category combination and stream results to `output`.
+
+    `output` is a path (appended to), a writable text stream or a RunStore.
+    With a RunStore, combinations it already holds are skipped and counted
+    in the summary's `skipped`, so an interrupted run can be resumed. At most
+    `concurrency` requests are in flight and only those are held in memory;
+    size the OpenRouterClient's connection pool to at least `concurrency`.
+    Pass a ResponseCache as `cache` to skip prompts that were already answered,
+    and a SingleFlight as `flights` to share calls with identical ones in flight.
+    With `max_tokens=None` limits come from the AdaptiveLimits in `limits`.
+    `on_result(record, summary)` is called from the calling thread after each
+    record is written. Cancelling the CancelScope `cancel` aborts the calls in
+    flight, submits no more and raises the scope's error. Returns the final
+    summary dict.
+    """
+    templates = templates or CATEGORY_PROMPTS
+    categories = list(categories or templates.keys())
+    tasks = iter_tasks(prospects, categories)
+    summary = {"completed": 0, "succeeded": 0, "failed": 0, "skipped": 0, "elapsed": 0.0}
+    start = time.perf_counter()
+
+    store = output if isinstance(output, RunStore) else None
+    if store is not None:
+        out, close_output = None, False
+    elif isinstance(output, (str, os.PathLike)):
+        out = open(output, "a", encoding="utf-8")
+        close_output = True
+    else:
+        out, close_output = output, False
+
+    def submit_next(executor, pending):
+        if cancel is not None:
+            cancel.check()
+        while True:
+            task = next(tasks, None)
+            if task is None:
+                return False
+            prospect, category = task
+            if store is None or not store.is_done(task_key(prospect, category, model)):
+                break
+            summary["skipped"] += 1
+        pending.add(executor.submit(
+            run_one, prospect, category, templates[category],
+            client, model, temperature, max_tokens, cache, bypass_cache, time.perf_counter(), flights, limits,
+            cancel
+        ))
+        return True
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = set()
+            while len(pending) < concurrency and submit_next(executor, pending):
+                pass
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record = future.result()
+                    if store is not None:
+                        store.append(task_key(record, record["category"], model), record)
+                    else:
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+
+                    summary["completed"] += 1
+                    summary["succeeded" if record["status"] == "ok" else "failed"] += 1
+                    summary["elapsed"] = round(time.perf_counter() - start, 3)
+                    if on_result:
+                        on_result(record, summary)
+
+                    submit_next(executor, pending)
+    finally:
+        if close_output:
+            out.close()
+
+    summary["elapsed"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def open_uploaded_csv(uploaded_file):
+    """Wrap a binary upload (e.g. Streamlit's UploadedFile) as a text stream."""
+    return io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run category prompts for a CSV of prospects")
+    parser.add_argument("csv", help="Prospect CSV with first_name, last_name, city, state columns")
+    parser.add_argument("output", help="JSONL file to append results to (a run directory with --resumable)")
+    parser.add_argument("--model", default=MODELS[0], choices=MODELS)
+    parser.add_argument("--category", action="append", choices=list(CATEGORY_PROMPTS),
+                        help="Category to run (repeatable, default: all)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="Fixed completion limit (default: learned from past answers)")
+    parser.add_argument("--url", default=None, help="Override the chat-completions endpoint")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the response cache")
+    parser.add_argument("--resumable", action="store_true",
+                        help="Write chunked results plus a checkpoint to the output directory and skip "
+                             "combinations completed by an earlier run")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+    api_key = os.getenv("OPENROUTER_API_KEY", "")
+    if not api_key:
+        parser.error("OPENROUTER_API_KEY not found in environment variables.")
+
+    def report(record, summary):
+        print(f"\r{summary['completed']} done, {summary['failed']} failed, {summary['skipped']} skipped, "
+              f"{summary['elapsed']:.1f}s", end="", flush=True)
+
+    telemetry = TelemetryStore()
+    client = OpenRouterClient(api_key, url=args.url, pool_size=max(args.concurrency, DEFAULT_POOL_SIZE),
+                              telemetry=telemetry, scheduler=Scheduler())
+    output = RunStore(args.output) if args.resumable else args.output
+    try:
+        summary = run_batch(
+            read_prospects(args.csv), client, args.model, output,
+            categories=args.category, concurrency=args.concurrency, max_tokens=args.max_tokens,
+            cache=None if args.no_cache else ResponseCache(), on_result=report,
+            limits=AdaptiveLimits(telemetry)
+        )
+    finally:
+        if args.resumable:
+            output.close()
+    print()
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
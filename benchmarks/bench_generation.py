@@ -0,0 +1,421 @@
+"""
+Offline benchmark suite for the generation path
+Starts mock_server.py in-process and drives the real client, batch runner and
+Streamlit script through it, reporting throughput, latency percentiles and
+memory high-water marks. Results are written as JSON so runs can be compared.
+
+    python benchmarks/bench_generation.py
+    python benchmarks/bench_generation.py --latency 0.2 --jitter 0.1 --error-rate 0.05
+    python benchmarks/bench_generation.py --compare benchmarks/results/<earlier run>.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep benchmark traffic out of the real response cache and telemetry log
+SCRATCH_DIR = tempfile.mkdtemp(prefix="kc-bench-")
+os.environ["KC_RESPONSE_CACHE"] = os.path.join(SCRATCH_DIR, "responses.sqlite3")
+os.environ["KC_TELEMETRY_PATH"] = os.path.join(SCRATCH_DIR, "telemetry.jsonl")
+
+import batch  # noqa: E402
+import dossier  # noqa: E402
+from cancellation import CancelScope  # noqa: E402
+from coalesce import SingleFlight  # noqa: E402
+from jobs import DONE, JobCancelled, JobManager  # noqa: E402
+from mock_server import start_mock_server  # noqa: E402
+from openrouter import MODELS, OpenRouterClient, OpenRouterError, format_prompt  # noqa: E402
+from prompts import CATEGORY_PROMPTS  # noqa: E402
+from research import Researcher  # noqa: E402
+from telemetry import percentile  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+PROSPECT = {"full_name": "Jordan Avery", "city": "Phoenix", "state": "AZ"}
+
+# Metrics where a larger number is a regression when comparing runs
+LOWER_IS_BETTER = ("latency", "ttft", "peak", "rerun", "elapsed")
+
+
+def latency_stats(values):
+    return {
+        "p50": round(percentile(values, 50), 4) if values else None,
+        "p95": round(percentile(values, 95), 4) if values else None,
+        "p99": round(percentile(values, 99), 4) if values else None,
+        "max": round(max(values), 4) if values else None,
+    }
+
+
+def measured(scenario):
+    """Run `scenario()` under tracemalloc and attach wall time and peak Python heap."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = scenario()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result["elapsed_s"] = round(elapsed, 3)
+    result["peak_python_heap_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def bench_single(client, requests_count):
+    """Sequential non-streamed calls: the interactive Generate path."""
+    prompt = format_prompt(CATEGORY_PROMPTS["Profile"], **PROSPECT)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        try:
+            latencies.append(client.chat_completion(MODELS[0], prompt).latency)
+        except OpenRouterError:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests_count,
+        "errors": errors,
+        "requests_per_s": round(requests_count / elapsed, 2),
+        "latency_s": latency_stats(latencies),
+    }
+
+
+def bench_batch(client, prospects_count, concurrency):
+    """CSV batch across every category with bounded concurrency."""
+    rows = ["first_name,last_name,city,state"]
+    rows += [f"Prospect{i},Test,Phoenix,AZ" for i in range(prospects_count)]
+    latencies = []
+
+    def collect(record, summary):
+        latencies.append(record["latency"])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        summary = batch.run_batch(
+            batch.read_prospects(io.StringIO("\n".join(rows))), client, MODELS[0],
+            os.path.join(tmp, "results.jsonl"), concurrency=concurrency, on_result=collect
+        )
+    return {
+        "prospects": prospects_count,
+        "categories": len(CATEGORY_PROMPTS),
+        "concurrency": concurrency,
+        "requests": summary["completed"],
+        "errors": summary["failed"],
+        "requests_per_s": round(summary["completed"] / summary["elapsed"], 2),
+        "latency_s": latency_stats(latencies),
+    }
+
+
+def bench_streaming(client, requests_count, concurrency):
+    """Concurrent streamed calls: time-to-first-token versus total latency."""
+    # A non-ASCII name checks that streamed text is decoded as UTF-8
+    prospect = dict(PROSPECT, full_name="José Ávila")
+    prompt = format_prompt(CATEGORY_PROMPTS["News"], **prospect)
+
+    def one(_):
+        try:
+            return client.stream_chat_completion(MODELS[0], prompt)
+        except OpenRouterError:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        completions = list(executor.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - start
+    ok = [c for c in completions if c is not None]
+    return {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": requests_count - len(ok),
+        "garbled": sum(1 for c in ok if "•" not in c.text or prospect["full_name"] not in c.text),
+        "requests_per_s": round(requests_count / elapsed, 2),
+        "ttft_s": latency_stats([c.ttft for c in ok if c.ttft is not None]),
+        "latency_s": latency_stats([c.latency for c in ok]),
+    }
+
+
+def run_dossier_jobs(job_manager, researcher, full_name, combined):
+    """Queue a dossier on the job executor the way the app's Dossier page does and wait for it."""
+    job_ids = []
+    for category, prompt, max_tokens in dossier.dossier_requests(full_name, "Phoenix", "AZ",
+                                                                  combined=combined).values():
+        def work(job, prompt=prompt, category=category, max_tokens=max_tokens):
+            return researcher.complete(MODELS[0], prompt, max_tokens=max_tokens, stream=True,
+                                       on_text=job.on_text, category=category)
+        job_ids.append(job_manager.submit(work, f"{full_name} · {category}"))
+    jobs = job_manager.jobs(job_ids)
+    for job in jobs:
+        job.future.result()
+    return jobs
+
+
+def bench_dossier(client, prospects_count):
+    """Full dossier per prospect: seven concurrent jobs versus one combined job."""
+    job_manager = JobManager()
+    researcher = Researcher(client)
+    parallel, combined, errors = [], [], 0
+    try:
+        for i in range(prospects_count):
+            for timings, as_one in ((parallel, False), (combined, True)):
+                start = time.perf_counter()
+                jobs = run_dossier_jobs(job_manager, researcher, f"Prospect{i} Test", as_one)
+                timings.append(time.perf_counter() - start)
+                errors += sum(1 for job in jobs if job.status != DONE)
+    finally:
+        job_manager.shutdown()
+    return {
+        "prospects": prospects_count,
+        "errors": errors,
+        "parallel_latency_s": latency_stats(parallel),
+        "combined_latency_s": latency_stats(combined),
+    }
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Benchmark scenario stalled")
+        time.sleep(0.001)
+
+
+def run_coalesced(flights, client, prompt, key, cancelled):
+    """
+    One leader and one follower sharing a streamed call through `flights`.
+
+    The shared call is held until the follower has attached, and each caller
+    named in `cancelled` ("leader", "follower") cancels its own CancelScope
+    when its first chunk arrives, so every run takes the same interleaving.
+    Returns {caller: Completion or the exception raised}, plus the seconds
+    from releasing the call to the leader returning.
+    """
+    gate = threading.Event()
+    scopes = {"leader": CancelScope(), "follower": CancelScope()}
+    outcomes = {}
+
+    def call(on_text, scope):
+        gate.wait()
+        return client.stream_chat_completion(MODELS[0], prompt, on_text=on_text, cancel=scope)
+
+    def caller(name):
+        scope = scopes[name]
+
+        def on_text(delta, text):
+            if name in cancelled:
+                scope.cancel(JobCancelled())
+                scope.check()
+        try:
+            outcomes[name] = flights.run(key, call, on_text, scope)
+        except Exception as e:
+            outcomes[name] = e
+
+    stats = flights.stats()
+    threads = {name: threading.Thread(target=caller, args=(name,)) for name in scopes}
+    threads["leader"].start()
+    wait_until(lambda: flights.stats()["leaders"] > stats["leaders"])
+    threads["follower"].start()
+    wait_until(lambda: flights.stats()["saved"] > stats["saved"])
+    start = time.perf_counter()
+    gate.set()
+    threads["leader"].join()
+    elapsed = time.perf_counter() - start
+    threads["follower"].join()
+    return outcomes, elapsed
+
+
+def bench_coalescing(client, rounds):
+    """
+    Cancellation interleavings of a coalesced call, checked for the right outcome.
+
+    `wrong` counts interleavings where a caller got the wrong result: a
+    follower losing the answer because the leader's caller gave up, a
+    cancelled caller still getting one, a call nobody waits for running to
+    the end, or a later identical call joining an aborted one.
+    """
+    flights = SingleFlight()
+    prompt = format_prompt(CATEGORY_PROMPTS["News"], **PROSPECT)
+    wrong, abort, full = 0, [], []
+
+    def answered(outcome):
+        return not isinstance(outcome, Exception) and bool(outcome.text)
+
+    for i in range(rounds):
+        outcomes, elapsed = run_coalesced(flights, client, prompt, f"none-{i}", ())
+        full.append(elapsed)
+        wrong += not (answered(outcomes["leader"]) and answered(outcomes["follower"])
+                      and outcomes["follower"].coalesced and outcomes["follower"].text == outcomes["leader"].text)
+
+        outcomes, _ = run_coalesced(flights, client, prompt, f"leader-{i}", ("leader",))
+        wrong += not (answered(outcomes["follower"]) and outcomes["follower"].coalesced)
+
+        outcomes, _ = run_coalesced(flights, client, prompt, f"follower-{i}", ("follower",))
+        wrong += not (answered(outcomes["leader"]) and isinstance(outcomes["follower"], JobCancelled))
+
+        key = f"both-{i}"
+        outcomes, elapsed = run_coalesced(flights, client, prompt, key, ("leader", "follower"))
+        abort.append(elapsed)
+        wrong += not all(isinstance(outcome, JobCancelled) for outcome in outcomes.values())
+
+        # The aborted call is gone, so the same request starts afresh
+        again = flights.run(key, lambda on_text, scope: client.stream_chat_completion(
+            MODELS[0], prompt, on_text=on_text, cancel=scope))
+        wrong += not (answered(again) and not again.coalesced)
+    wrong += flights.stats()["in_flight"] != 0
+    return {
+        "rounds": rounds,
+        "interleavings": 5 * rounds,
+        "wrong": wrong,
+        "shared_latency_s": latency_stats(full),
+        "abort_latency_s": latency_stats(abort),
+    }
+
+
+def bench_rerun(reruns):
+    """
+    Cost of one Streamlit script rerun of app.py, without any API call.
+
+    `rerun_s` is wall time as seen by the test harness; `script_s` and
+    `editor_s` are the page's own timings of a full run and of the prompt
+    editor fragment, which is all that reruns when only the prompt is edited.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    app.run()
+    timings = []
+    for i in range(reruns):
+        # Touch a sidebar input like a user typing, which is what triggers real reruns
+        app.sidebar.text_input(key="city").set_value(f"City {i}")
+        start = time.perf_counter()
+        app.run()
+        timings.append(time.perf_counter() - start)
+    editor = app.text_area(key=f"prompt_textarea_{app.sidebar.selectbox[0].value}")
+    for i in range(reruns):
+        editor.set_value(f"{editor.value} edit {i}").run()
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+    scripts = {}
+    for scope, seconds in app.session_state["run_timings"]:
+        scripts.setdefault(scope, []).append(seconds)
+    return {
+        "reruns": reruns,
+        "rerun_s": latency_stats(timings),
+        "rerun_mean_s": round(sum(timings) / reruns, 4),
+        "script_s": latency_stats(scripts["app"][1:]),
+        "editor_s": latency_stats(scripts["editor"][1:]),
+    }
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous, current):
+    """Print metrics that moved between two result files."""
+    before = flatten(previous["scenarios"])
+    after = flatten(current["scenarios"])
+    print(f"\nCompared with {previous['started_at']}:")
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        if not old or old == new:
+            continue
+        change = (new - old) / old * 100
+        worse = change > 0 if any(word in name for word in LOWER_IS_BETTER) else change < 0
+        flag = "  <-- regression" if worse and abs(change) >= 10 else ""
+        print(f"  {name:45} {old:>10} -> {new:<10} ({change:+.1f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation path against a mock OpenRouter server")
+    parser.add_argument("--latency", type=float, default=0.1, help="Mock response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform +/- jitter on the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--token-interval", type=float, default=0.005, help="Delay between streamed chunks")
+    parser.add_argument("--chunk-words", type=int, default=4, help="Words per streamed chunk")
+    parser.add_argument("--single", type=int, default=20, help="Sequential single calls")
+    parser.add_argument("--prospects", type=int, default=20, help="Prospects in the batch scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--streams", type=int, default=32, help="Streamed calls")
+    parser.add_argument("--dossiers", type=int, default=5, help="Prospects in the dossier scenario")
+    parser.add_argument("--coalescing", type=int, default=5,
+                        help="Rounds of coalesced-call cancellation interleavings")
+    parser.add_argument("--token-latency", type=float, default=0.0005,
+                        help="Mock non-streamed delay per completion token")
+    parser.add_argument("--reruns", type=int, default=20, help="Streamlit reruns to time (0 to skip)")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, retry_after=0.05,
+        token_interval=args.token_interval, chunk_words=args.chunk_words, token_latency=args.token_latency
+    )
+    os.environ["OPENROUTER_API_URL"] = server.url
+    client = OpenRouterClient("benchmark", url=server.url, pool_size=max(args.concurrency, 32),
+                              backoff_base=0.05)
+
+    plan = [
+        ("single", lambda: bench_single(client, args.single)),
+        ("batch_all_categories", lambda: bench_batch(client, args.prospects, args.concurrency)),
+        ("streaming", lambda: bench_streaming(client, args.streams, args.concurrency)),
+        ("dossier", lambda: bench_dossier(client, args.dossiers)),
+        ("coalescing", lambda: bench_coalescing(client, args.coalescing)),
+    ]
+    if args.reruns:
+        plan.append(("streamlit_rerun", lambda: bench_rerun(args.reruns)))
+
+    scenarios = {}
+    try:
+        for name, scenario in plan:
+            print(f"Running {name}...", flush=True)
+            scenarios[name] = measured(scenario)
+    finally:
+        client.close()
+        server.shutdown()
+
+    results = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "mock": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "token_interval": args.token_interval,
+            "chunk_words": args.chunk_words,
+            "token_latency": args.token_latency,
+        },
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        "scenarios": scenarios,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
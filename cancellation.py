@@ -0,0 +1,69 @@
+"""
+Cancellation scopes
+A handle one thread uses to stop work running on another. Calls made under a
+scope register how to abort themselves (the OpenRouter client shuts down the
+socket it is reading), so cancelling stops them at once instead of at their
+next streamed chunk or when the read timeout expires.
+"""
+
+import itertools
+import threading
+
+
+class CancelScope:
+    """
+    Cancellation handle shared between the thread doing the work and the ones that may stop it.
+
+    cancel(error) runs every subscribed callback once and makes check()
+    raise `error`; the first error given wins. Safe to share between threads.
+    """
+
+    def __init__(self):
+        self.error = None
+        self._callbacks = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.error is not None
+
+    def check(self):
+        """Raise the cancellation error if the scope was cancelled."""
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self, error):
+        with self._lock:
+            if self.error is not None:
+                return
+            self.error = error
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        self._event.set()
+        for callback in callbacks:
+            callback()
+
+    def wait(self, timeout):
+        """Sleep up to `timeout` seconds, waking early on cancellation; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def subscribe(self, callback):
+        """
+        Call `callback()` on cancellation and return a token for unsubscribe().
+
+        If the scope is already cancelled the callback runs right away and
+        None is returned.
+        """
+        with self._lock:
+            if self.error is None:
+                token = next(self._ids)
+                self._callbacks[token] = callback
+                return token
+        callback()
+        return None
+
+    def unsubscribe(self, token):
+        with self._lock:
+            self._callbacks.pop(token, None)
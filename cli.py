@@ -0,0 +1,88 @@
+"""
+Command-line research
+Runs category prompts for one prospect without starting Streamlit.
+
+    python cli.py John Smith Phoenix AZ --category Profile --stream
+    python cli.py John Smith Phoenix AZ --all --json > dossier.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from openrouter import MODELS
+from prompts import CATEGORY_PROMPTS
+from research import Prospect, Researcher
+
+
+def print_result(result, as_json, streamed=False):
+    if as_json:
+        print(json.dumps(result.to_dict(), ensure_ascii=False))
+        return
+    if result.error:
+        print(f"[{result.category}] {result.error}", file=sys.stderr)
+        return
+    if not streamed:
+        print(f"## {result.category}\n\n{result.text}\n")
+    tokens = f"{result.usage.get('prompt_tokens')} in / {result.usage.get('completion_tokens')} out"
+    source = " (cached)" if result.cached else " (shared)" if result.coalesced else ""
+    if result.hedged:
+        source += f" (hedged, answered by {result.answered_by})"
+    print(f"[{result.category}] {result.latency:.2f}s{source} · {tokens}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Research one prospect with the Knowledge Core prompts")
+    parser.add_argument("first_name")
+    parser.add_argument("last_name")
+    parser.add_argument("city")
+    parser.add_argument("state")
+    parser.add_argument("--category", action="append", choices=list(CATEGORY_PROMPTS),
+                        help="Category to run (repeatable, default: Profile)")
+    parser.add_argument("--all", action="store_true", help="Run every category concurrently")
+    parser.add_argument("--template", help="Path to a custom prompt template instead of a category")
+    parser.add_argument("--model", default=MODELS[0], choices=MODELS)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it arrives (one category only)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON result per line")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Also ask the model's fallback when the first token is slow to arrive")
+    parser.add_argument("--url", default=None, help="Override the chat-completions endpoint")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the response cache")
+    args = parser.parse_args(argv)
+
+    try:
+        researcher = Researcher.from_env(url=args.url, use_cache=not args.no_cache)
+    except ValueError as e:
+        parser.error(str(e))
+
+    prospect = Prospect(args.first_name, args.last_name, args.city, args.state)
+    options = {"max_tokens": args.max_tokens} if args.max_tokens else {}
+    if args.hedge:
+        options["hedge"] = True
+    categories = list(CATEGORY_PROMPTS) if args.all else args.category or ["Profile"]
+    streamed = args.stream and not args.json and not args.template and len(categories) == 1
+    try:
+        if args.template:
+            with open(args.template, encoding="utf-8") as f:
+                results = [researcher.research(prospect, template=f.read(), model=args.model, **options)]
+        elif len(categories) > 1:
+            results = asyncio.run(researcher.aresearch_many(prospect, categories, model=args.model, **options))
+        else:
+            if streamed:
+                print(f"## {categories[0]}\n")
+                options.update(stream=True, on_text=lambda delta, text: print(delta, end="", flush=True))
+            results = [researcher.research(prospect, categories[0], model=args.model, **options)]
+            if streamed:
+                print("\n")
+    finally:
+        researcher.close()
+
+    for result in results:
+        print_result(result, args.json, streamed)
+    return 0 if all(r.ok for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
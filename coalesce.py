@@ -0,0 +1,165 @@
+"""
+Single-flight request coalescing
+When an identical generation (same model, rendered prompt, temperature and
+max_tokens) is already in flight, later callers attach to it instead of paying
+for another OpenRouter call. Followers receive the leader's result, and while
+it streams they see the same text as it arrives.
+"""
+
+import dataclasses
+import threading
+import time
+
+from cancellation import CancelScope
+
+
+class Flight:
+    """One in-flight call and the partial text it has produced so far."""
+
+    def __init__(self):
+        self.text = ""
+        self.version = 0
+        self.done = False
+        self.result = None
+        self.error = None
+        self.followers = 0
+        # Whether the leader's own caller still wants the result
+        self.listening = True
+        # Set when everyone waiting for the call gave up (e.g. their users cancelled);
+        # later callers then start a new flight instead of joining this one
+        self.abandoned = False
+        # Aborts the shared call once it is abandoned
+        self.scope = CancelScope()
+
+
+class SingleFlight:
+    """Process-wide table of in-flight calls keyed by request hash, safe to share between threads."""
+
+    def __init__(self):
+        self._flights = {}
+        self._cond = threading.Condition()
+        self.leaders = 0
+        self.saved = 0
+
+    def run(self, key, call, on_text=None, cancel=None):
+        """
+        Return `call(on_text, scope)` for the first caller with `key`, or that call's result for later ones.
+
+        `call` receives a streaming callback and a CancelScope to pass down to
+        the client. A follower's `on_text` replays the text streamed so far,
+        then every later chunk. A caller whose `on_text` raises, or whose
+        CancelScope `cancel` is cancelled, stops waiting; the shared call is
+        only aborted once nobody is waiting for it. Errors from the shared call
+        are raised in every caller. Followers get a copy of the Completion with
+        `coalesced` set.
+        """
+        with self._cond:
+            flight = self._flights.get(key)
+            if flight is None or flight.abandoned:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                flight.followers += 1
+                self.saved += 1
+                leader = False
+
+        if leader:
+            return self._lead(key, flight, call, on_text, cancel)
+        return self._follow(flight, on_text, cancel)
+
+    def _abandon_if_unwanted(self, flight, error):
+        """Abort the shared call with `error` if neither the leader's caller nor any follower waits for it."""
+        # Decided under the lock so nobody can attach to a call that is about to stop
+        with self._cond:
+            abort = not flight.listening and not flight.followers and not flight.done
+            if abort:
+                flight.abandoned = True
+        if abort:
+            flight.scope.cancel(error)
+        return abort
+
+    def _stop_listening(self, flight, error):
+        with self._cond:
+            flight.listening = False
+        return self._abandon_if_unwanted(flight, error)
+
+    def _lead(self, key, flight, call, on_text, cancel):
+        def publish(delta, text):
+            with self._cond:
+                flight.text = text
+                flight.version += 1
+                self._cond.notify_all()
+            if on_text is not None and flight.listening:
+                try:
+                    on_text(delta, text)
+                except Exception as e:
+                    # The leader's own caller stopped listening; keep the call alive for followers
+                    if self._stop_listening(flight, e):
+                        raise
+
+        token = cancel.subscribe(lambda: self._stop_listening(flight, cancel.error)) if cancel else None
+        try:
+            result = call(publish, flight.scope)
+        except Exception as e:
+            with self._cond:
+                flight.error = e
+                raise
+        else:
+            flight.result = result
+            return result
+        finally:
+            if token is not None:
+                cancel.unsubscribe(token)
+            with self._cond:
+                flight.done = True
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                self._cond.notify_all()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _follow(self, flight, on_text, cancel):
+        start = time.perf_counter()
+        seen = 0
+        sent = ""
+        token = cancel.subscribe(self._wake) if cancel else None
+        try:
+            while True:
+                with self._cond:
+                    while not flight.done and flight.version == seen:
+                        if cancel is not None:
+                            cancel.check()
+                        self._cond.wait()
+                    text, seen, done = flight.text, flight.version, flight.done
+                if done:
+                    break
+                if on_text and text != sent:
+                    # A retried call (e.g. after truncation) restarts its text from scratch
+                    on_text(text[len(sent):] if text.startswith(sent) else text, text)
+                    sent = text
+        except Exception as e:
+            with self._cond:
+                flight.followers -= 1
+            self._abandon_if_unwanted(flight, e)
+            raise
+        else:
+            with self._cond:
+                flight.followers -= 1
+        finally:
+            if token is not None:
+                cancel.unsubscribe(token)
+
+        if flight.error is not None:
+            raise flight.error
+        result = dataclasses.replace(flight.result, coalesced=True, latency=time.perf_counter() - start,
+                                     ttft=None, ttfb=None, queue_wait=0.0)
+        if on_text and result.text != sent:
+            on_text(result.text[len(sent):] if result.text.startswith(sent) else result.text, result.text)
+        return result
+
+    def stats(self):
+        with self._cond:
+            return {"in_flight": len(self._flights), "leaders": self.leaders, "saved": self.saved}
@@ -0,0 +1,47 @@
+"""
+Multi-model comparison
+Helpers for the Compare page, which runs the same formatted prompt as one job
+per model and reports each answer as soon as it lands, with latency, token
+usage and estimated cost
+"""
+
+import requests
+
+from openrouter import OpenRouterError, describe_error, estimate_cost
+from generation import complete
+
+
+def run_model(client, model, prompt, temperature, max_tokens, cache, bypass_cache, **kwargs):
+    """Return (completion, error message) for one model."""
+    try:
+        completion = complete(
+            client, model, prompt, temperature, max_tokens, cache=cache, bypass_cache=bypass_cache, **kwargs
+        )
+        return completion, None
+    except (OpenRouterError, requests.exceptions.RequestException) as e:
+        return None, describe_error(e)
+
+
+def summary_row(model, completion, error, elapsed=None):
+    """One row of the comparison table; `elapsed` is the time spent on a failed call."""
+    if completion is None:
+        return {
+            "Model": model,
+            "Status": f"❌ {error}",
+            "Latency (s)": round(elapsed, 2) if elapsed is not None else None,
+            "Prompt tokens": None,
+            "Cached prompt tokens": None,
+            "Completion tokens": None,
+            "Est. cost ($)": None,
+        }
+    usage = completion.usage
+    cost = estimate_cost(model, usage)
+    return {
+        "Model": model,
+        "Status": "⚡ cached" if completion.cached else "🔗 shared" if completion.coalesced else "✅ ok",
+        "Latency (s)": round(completion.latency, 2),
+        "Prompt tokens": usage.get("prompt_tokens"),
+        "Cached prompt tokens": completion.cached_tokens,
+        "Completion tokens": usage.get("completion_tokens"),
+        "Est. cost ($)": round(cost, 5) if cost is not None else None,
+    }
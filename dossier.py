@@ -0,0 +1,63 @@
+"""
+Prospect dossier
+Builds the requests for every category prompt of one prospect, which the app
+dispatches concurrently so a full dossier takes about as long as the slowest
+category instead of the sum of all seven. A single combined request is
+available as a variant for comparison.
+"""
+
+import re
+
+from prompts import CATEGORY_PROMPTS, RenderedPrompt, render_prompt
+
+# Seven sections of ~400 tokens each plus headings
+COMBINED_MAX_TOKENS = 6000
+COMBINED_CATEGORY = "Dossier (combined)"
+
+COMBINED_INSTRUCTIONS = (
+    "You are preparing a prospect dossier with {count} sections. Write every section listed "
+    "below, in the order given. Start each section with a line containing only \"## \" followed "
+    "by the section name exactly as written, then follow that section's instructions on their own."
+)
+
+
+def build_combined_prompt(full_name, city, state, templates=None):
+    """One prompt asking for every category as a `## <category>` section."""
+    templates = templates or CATEGORY_PROMPTS
+    prefix_parts = [COMBINED_INSTRUCTIONS.format(count=len(templates))]
+    suffix_parts = []
+    for category, template in templates.items():
+        rendered = render_prompt(template, full_name, city, state)
+        prefix_parts.append(f"## {category} instructions\n\n{rendered.prefix}")
+        suffix_parts.append(f"## {category}: {rendered.suffix}")
+    return RenderedPrompt("\n\n".join(prefix_parts), "\n".join(suffix_parts))
+
+
+def split_combined_response(text, categories):
+    """Map each category to its section of a combined answer (missing sections are absent)."""
+    names = "|".join(re.escape(c) for c in categories)
+    pattern = re.compile(rf"^\s*#+\s*\**({names})\**\s*:?\s*$", re.MULTILINE | re.IGNORECASE)
+    matches = list(pattern.finditer(text))
+    by_lower = {c.lower(): c for c in categories}
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        sections[by_lower[match.group(1).lower()]] = text[match.end():end].strip()
+    return sections
+
+
+def dossier_requests(full_name, city, state, templates=None, combined=False):
+    """
+    The calls that make up one dossier, as {key: (category, prompt, max_tokens)}.
+
+    One call per category keyed by category, or a single call keyed
+    "combined". A max_tokens of None leaves the limit to the caller's
+    default. Raises KeyError if any template uses an unknown variable, so
+    nothing is sent for a half-formatted dossier.
+    """
+    templates = templates or CATEGORY_PROMPTS
+    if combined:
+        prompt = build_combined_prompt(full_name, city, state, templates)
+        return {"combined": (COMBINED_CATEGORY, prompt, COMBINED_MAX_TOKENS)}
+    return {category: (category, render_prompt(template, full_name, city, state), None)
+            for category, template in templates.items()}
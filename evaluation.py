@@ -0,0 +1,187 @@
+"""
+Prompt A/B evaluation
+Runs prompt variants over a fixed set of prospects, several samples each and
+across models, then scores every answer against the output format all
+templates ask for: exactly three • bullets, one paragraph of 150-250 words, no
+leaked research notes or reasoning, and mentions of the prospect's name and
+city. Pass rates come with Wilson confidence intervals.
+"""
+
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from compare import run_model
+from openrouter import DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE, format_prompt
+from research import Prospect
+from scheduler import BULK
+from telemetry import percentile, rounded
+
+EVAL_PROSPECTS = [
+    Prospect("John", "Smith", "Phoenix", "AZ"),
+    Prospect("Maria", "Garcia", "San Antonio", "TX"),
+    Prospect("David", "Chen", "Seattle", "WA"),
+    Prospect("Aisha", "Johnson", "Atlanta", "GA"),
+    Prospect("Robert", "O'Brien", "Boston", "MA"),
+    Prospect("Priya", "Patel", "Edison", "NJ"),
+    Prospect("James", "Wilson", "Des Moines", "IA"),
+    Prospect("Elena", "Kowalski", "Milwaukee", "WI"),
+]
+
+DEFAULT_SAMPLES = 3
+DEFAULT_CONCURRENCY = 8
+MIN_WORDS = 150
+MAX_WORDS = 250
+
+CHECKS = ("Three bullets", "One paragraph", "150-250 words", "No leakage", "Mentions name", "Mentions city")
+
+# Scaffolding the templates forbid: research notes, visible reasoning, drafts and note-style
+# headings or labels. Plain uses of words like "research" ("supports cancer research") are fine.
+LEAKAGE = re.compile(
+    r"\bresearch (?:notes?|process|methodology)\b"
+    r"|<think>"
+    r"|^[#*_\s]*(?:reasoning|thinking|notes?|draft(?: \d+)?|methodology|sources)[*_\s]*(?::|$)",
+    re.MULTILINE
+)
+# Cheap substring test run before the regex
+LEAKAGE_HINTS = ("research ", "<think>", "reasoning", "thinking", "note", "draft", "methodology", "sources")
+
+
+def check_output(text, prospect):
+    """
+    Structural checks for one answer; returns a tuple of booleans in CHECKS order.
+
+    Kept to plain string operations (the regex only runs when a hint of
+    leakage is present) so thousands of answers score in a fraction of a second.
+    """
+    lowered = text.lower()
+    bullets = 0
+    paragraphs = 0
+    words = 0
+    in_paragraph = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("•"):
+            bullets += 1
+            in_paragraph = False
+        elif line:
+            words += len(line.split())
+            paragraphs += not in_paragraph
+            in_paragraph = True
+        else:
+            in_paragraph = False
+    leaked = any(hint in lowered for hint in LEAKAGE_HINTS) and LEAKAGE.search(lowered) is not None
+    return (
+        bullets == 3,
+        paragraphs == 1,
+        MIN_WORDS <= words <= MAX_WORDS,
+        not leaked,
+        prospect.last_name.lower() in lowered,
+        prospect.city.lower() in lowered,
+    )
+
+
+def score_outputs(records):
+    """Add `checks` and `passed` to every successful record in place; returns the records."""
+    for record in records:
+        if record["error"] is None:
+            checks = check_output(record["text"], record["prospect"])
+            record["checks"] = checks
+            record["passed"] = all(checks)
+    return records
+
+
+def wilson_interval(successes, trials, z=1.96):
+    """Wilson score interval (low, high) for a binomial proportion, or (None, None) without trials."""
+    if not trials:
+        return None, None
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (p + z * z / (2 * trials)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def iter_tasks(variants, models, prospects, samples):
+    for name in variants:
+        for model in models:
+            for prospect in prospects:
+                for sample in range(samples):
+                    yield name, model, prospect, sample
+
+
+def run_evaluation(client, variants, models, prospects=None, samples=DEFAULT_SAMPLES, category=None,
+                   concurrency=DEFAULT_CONCURRENCY, temperature=DEFAULT_TEMPERATURE,
+                   max_tokens=DEFAULT_MAX_TOKENS, on_result=None, cancel=None):
+    """
+    Generate `samples` answers per variant, model and prospect, then score them all.
+
+    `variants` maps a label to a template. Calls skip the response cache and
+    request sharing so every sample is a real, independent generation, and
+    run at bulk priority. `on_result(record, done, total)` is called as each
+    call finishes. Cancelling the CancelScope `cancel` aborts the calls in
+    flight, skips the rest and raises the scope's error. Returns the scored
+    records.
+    """
+    prospects = prospects or EVAL_PROSPECTS
+    tasks = list(iter_tasks(variants, models, prospects, samples))
+    records = []
+
+    def run(name, model, prospect, sample):
+        if cancel is not None:
+            cancel.check()
+        record = {"variant": name, "model": model, "prospect": prospect, "sample": sample,
+                  "text": None, "latency": None, "error": None, "checks": None, "passed": False}
+        start = time.perf_counter()
+        try:
+            prompt = format_prompt(variants[name], prospect.full_name, prospect.city, prospect.state)
+        except KeyError as e:
+            record["error"] = f"Prompt formatting error: Missing variable {e}"
+            return record
+        completion, error = run_model(client, model, prompt, temperature, max_tokens, None, True,
+                                      category=category, priority=BULK, cancel=cancel)
+        record["latency"] = completion.latency if completion else time.perf_counter() - start
+        record["text"] = completion.text if completion else None
+        record["error"] = error
+        return record
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(tasks))))
+    try:
+        futures = [executor.submit(run, *task) for task in tasks]
+        for future in as_completed(futures):
+            records.append(future.result())
+            if on_result:
+                on_result(records[-1], len(records), len(tasks))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return score_outputs(records)
+
+
+def summarize_evaluation(records):
+    """One row per variant and model with pass rate, its 95% interval, per-check rates and latency."""
+    groups = {}
+    for record in records:
+        groups.setdefault((record["variant"], record["model"]), []).append(record)
+
+    rows = []
+    for (variant, model), group in groups.items():
+        scored = [r for r in group if r["checks"] is not None]
+        passed = sum(1 for r in scored if r["passed"])
+        low, high = wilson_interval(passed, len(scored))
+        latencies = [r["latency"] for r in scored]
+        row = {
+            "Variant": variant,
+            "Model": model,
+            "Samples": len(group),
+            "Errors": len(group) - len(scored),
+            "Pass rate %": rounded(100 * passed / len(scored), 1) if scored else None,
+            "95% CI": f"{100 * low:.0f}-{100 * high:.0f}%" if scored else None,
+        }
+        for i, check in enumerate(CHECKS):
+            hits = sum(1 for r in scored if r["checks"][i])
+            row[f"{check} %"] = rounded(100 * hits / len(scored), 1) if scored else None
+        row["p50 (s)"] = rounded(percentile(latencies, 50))
+        row["p95 (s)"] = rounded(percentile(latencies, 95))
+        rows.append(row)
+    return rows
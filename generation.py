@@ -0,0 +1,102 @@
+"""
+Generation pipeline
+One generation goes through the response cache, then request sharing
+(SingleFlight), hedging against a fallback model (HedgePolicy) and adaptive
+max_tokens with retries on truncation (AdaptiveLimits) before reaching the
+OpenRouterClient. complete() puts those steps together; each is optional.
+"""
+
+import time
+
+from openrouter import DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE, Completion, build_payload
+from response_cache import cache_key
+
+
+class Generation:
+    """One prompt to send, with the limits and hedging it goes through on a cache miss."""
+
+    def __init__(self, client, model, prompt, temperature, max_tokens, stream, limits, hedge, options):
+        self.client = client
+        self.model = model
+        self.prompt = prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # Hedged calls always stream so the race is decided on the first token
+        self.stream = stream or hedge is not None
+        self.limits = limits
+        self.hedge = hedge
+        self.options = options
+
+    def send(self, model, on_text, max_tokens, cancel, queued_at):
+        if self.stream:
+            return self.client.stream_chat_completion(
+                model, self.prompt, self.temperature, max_tokens, on_text=on_text, cancel=cancel,
+                queued_at=queued_at, **self.options
+            )
+        return self.client.chat_completion(model, self.prompt, self.temperature, max_tokens, cancel=cancel,
+                                           queued_at=queued_at, **self.options)
+
+    def sized(self, model, on_text, cancel, queued_at=None):
+        """send() with the fixed or learned max_tokens, retrying truncated answers with more."""
+        if self.max_tokens is not None:
+            return self.send(model, on_text, self.max_tokens, cancel, queued_at)
+        first = iter([queued_at])
+
+        def attempt(limit):
+            # A retry after truncation starts without queue wait
+            return self.send(model, on_text, limit, cancel, next(first, None))
+        if self.limits is not None:
+            return self.limits.run(attempt, self.options.get("category"), model)
+        return attempt(DEFAULT_MAX_TOKENS)
+
+    def run(self, on_text, cancel, queued_at):
+        """The Completion for the requested model, hedged with its fallback when there is a policy."""
+        if self.hedge is None:
+            return self.sized(self.model, on_text, cancel, queued_at)
+        # The fallback is sent after the hedge threshold, not from the caller's queue
+        return self.hedge.run(
+            lambda leg, on_text, cancel: self.sized(leg, on_text, cancel, queued_at if leg == self.model else None),
+            self.model, on_text, cancel
+        )
+
+
+def complete(client, model, prompt, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS,
+             cache=None, bypass_cache=False, stream=False, on_text=None, flights=None, limits=None,
+             hedge=None, cancel=None, queued_at=None, **kwargs):
+    """
+    client.chat_completion() (or its streaming variant with `stream`) behind a cache lookup.
+
+    Returns a Completion with `cached` set on a hit; a streamed hit is handed
+    to `on_text` in one piece. With `bypass_cache` the API is always called
+    and the fresh answer replaces whatever was cached. `cache` may be None to
+    disable caching. With a SingleFlight in `flights`, a call identical to one
+    already in flight waits for that call instead of sending its own. With
+    `max_tokens=None` the limit comes from the AdaptiveLimits in `limits` (or
+    the fixed default without one). With a HedgePolicy in `hedge`, a slow call
+    is raced against the model's fallback; answers from the fallback are not
+    cached under the requested model. Cancelling the CancelScope `cancel`
+    aborts the request, unless other callers share it. Extra keyword
+    arguments (timeouts, category, priority) are passed to the client.
+    """
+    payload = build_payload(model, prompt, temperature, max_tokens)
+    key = cache_key(model, payload["messages"], temperature, max_tokens)
+    if cache is not None and not bypass_cache:
+        start = time.perf_counter()
+        data = cache.get(key)
+        if data is not None:
+            completion = Completion(data, latency=time.perf_counter() - start, cached=True, model=model)
+            if on_text:
+                on_text(completion.text, completion.text)
+            return completion
+
+    generation = Generation(client, model, prompt, temperature, max_tokens, stream, limits, hedge, kwargs)
+
+    def call(on_text, cancel):
+        completion = generation.run(on_text, cancel, queued_at)
+        if cache is not None and completion.model == model:
+            cache.put(key, model, completion.data)
+        return completion
+
+    if flights is None:
+        return call(on_text, cancel)
+    return flights.run(key, call, on_text, cancel)
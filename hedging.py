@@ -0,0 +1,229 @@
+"""
+Hedged requests
+When the primary model has not produced its first token within a threshold
+(by default its recent p95 time-to-first-token from telemetry), the same
+prompt is sent to a fallback model as well. Whichever starts answering first
+wins; the other call is aborted right away, closing its connection.
+
+Fallbacks can be overridden with the KC_HEDGE_FALLBACKS environment variable, e.g.
+    KC_HEDGE_FALLBACKS='{"openai/gpt-5": "google/gemini-2.5-pro"}'
+"""
+
+import json
+import os
+import queue
+import threading
+
+from cancellation import CancelScope
+from telemetry import RollingWindow, percentile, rounded
+
+# Prefer a fallback from another provider, whose slow periods are unlikely to coincide
+DEFAULT_FALLBACKS = {
+    "google/gemini-3-pro-preview": "openai/gpt-4.1",
+    "google/gemini-2.5-pro": "openai/gpt-4.1",
+    "google/gemini-2.5-flash": "openai/gpt-4.1-mini",
+    "openai/gpt-5": "google/gemini-2.5-pro",
+    "openai/gpt-5-mini": "google/gemini-2.5-flash",
+    "openai/gpt-4.1": "google/gemini-2.5-flash",
+}
+DEFAULT_PERCENTILE = 95
+# Used until a model has this many streamed answers in telemetry
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_HEDGE_AFTER = 10.0
+DEFAULT_WINDOW = 24 * 3600
+
+
+def load_fallbacks():
+    raw = os.getenv("KC_HEDGE_FALLBACKS")
+    return {**DEFAULT_FALLBACKS, **json.loads(raw)} if raw else dict(DEFAULT_FALLBACKS)
+
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing call of a hedged pair to stop it."""
+
+    def __init__(self, message="Cancelled: a hedged request answered first"):
+        super().__init__(message)
+
+
+class Race:
+    """
+    Runs the hedged calls, each on its own thread under its own CancelScope.
+
+    The first call to produce a token owns the answer and the others are
+    cancelled with HedgeCancelled. `results` receives (model, completion,
+    error) as each call finishes.
+    """
+
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.winner = None
+        self.error = None
+        self.results = queue.Queue()
+        # Set once a call answers or finishes, or the race is cancelled
+        self.settled = threading.Event()
+        self._scopes = {}
+        self._lock = threading.Lock()
+
+    def start(self, generate, model):
+        """Run `generate(model, on_text, scope)` on a new thread, unless a call already won; True if started."""
+        scope = CancelScope()
+        with self._lock:
+            if self.winner is not None:
+                return False
+            self._scopes[model] = scope
+            error = self.error
+        if error is not None:
+            scope.cancel(error)
+        threading.Thread(target=self._leg, args=(generate, model, scope), name="kc-hedge", daemon=True).start()
+        return True
+
+    def _leg(self, generate, model, scope):
+        try:
+            self.results.put((model, generate(model, self.callback(model), scope), None))
+        except Exception as e:
+            self.results.put((model, None, e))
+        self.settled.set()
+
+    def claim(self, model):
+        with self._lock:
+            if self.winner is None:
+                self.winner = model
+                losers = [scope for name, scope in self._scopes.items() if name != model]
+            else:
+                losers = []
+            won = self.winner == model
+        for scope in losers:
+            scope.cancel(HedgeCancelled())
+        self.settled.set()
+        return won
+
+    def cancel(self, error):
+        """Abort every call with `error`, including ones started later."""
+        with self._lock:
+            self.error = error
+            scopes = list(self._scopes.values())
+        for scope in scopes:
+            scope.cancel(error)
+        self.settled.set()
+
+    def callback(self, model):
+        def on_text(delta, text):
+            if not self.claim(model):
+                raise HedgeCancelled()
+            if self.on_text:
+                self.on_text(delta, text)
+        return on_text
+
+
+class HedgePolicy:
+    """
+    Fallback models plus per-model hedge thresholds learned from a TelemetryStore.
+
+    A fixed `threshold` in seconds overrides the learned one. Safe to share
+    between threads; counters in stats() show how often hedging fired and
+    which model answered.
+    """
+
+    def __init__(self, telemetry=None, fallbacks=None, threshold=None, percentile=DEFAULT_PERCENTILE,
+                 min_samples=DEFAULT_MIN_SAMPLES, default_threshold=DEFAULT_HEDGE_AFTER,
+                 window=DEFAULT_WINDOW):
+        self.telemetry = telemetry
+        self.fallbacks = load_fallbacks() if fallbacks is None else fallbacks
+        self.fixed_threshold = threshold
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_threshold = default_threshold
+        self.window = window
+        self._thresholds = None if telemetry is None else RollingWindow(
+            telemetry, self._extract, self._summarize, window)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def threshold(self, model):
+        """Seconds to wait for the primary's first token before hedging."""
+        if self.fixed_threshold is not None:
+            return self.fixed_threshold
+        learned = self._thresholds.get().get(model) if self._thresholds is not None else None
+        return self.default_threshold if learned is None else learned
+
+    @staticmethod
+    def _extract(record):
+        if record.get("status_code") != 200 or record.get("ttft") is None:
+            return None
+        return record.get("model"), record["ttft"]
+
+    def _summarize(self, ttfts):
+        return {model: percentile(values, self.percentile)
+                for model, values in ttfts.items() if len(values) >= self.min_samples}
+
+    def _count(self, model, field):
+        with self._lock:
+            counts = self._counts.setdefault(model, {"calls": 0, "hedged": 0, "fallback_won": 0})
+            counts[field] += 1
+
+    def run(self, generate, model, on_text=None, cancel=None):
+        """
+        Return `generate(model, on_text, cancel)`, hedged with the model's fallback.
+
+        `generate` must stream through the callback it is given so the race
+        can be decided on the first token, and abort when the CancelScope it
+        is given is cancelled so the loser stops at once. Cancelling `cancel`
+        aborts every call. The returned Completion has `model` set to
+        whichever model answered and `hedged` set when the fallback was
+        fired. If every call fails, the primary's error is raised.
+        """
+        fallback = self.fallbacks.get(model)
+        if not fallback or fallback == model:
+            return generate(model, on_text, cancel)
+
+        self._count(model, "calls")
+        race = Race(on_text)
+        token = cancel.subscribe(lambda: race.cancel(cancel.error)) if cancel else None
+        try:
+            race.start(generate, model)
+            legs = 1
+            hedged = not race.settled.wait(self.threshold(model)) and race.start(generate, fallback)
+            if hedged:
+                self._count(model, "hedged")
+                legs += 1
+
+            errors = {}
+            for _ in range(legs):
+                name, completion, error = race.results.get()
+                if error is not None:
+                    if race.winner == name:
+                        # The call that was already answering failed; its error is the answer
+                        raise error
+                    errors[name] = error
+                    continue
+                if not race.claim(name):
+                    # Finished without streaming any text after the other call had already won
+                    continue
+                completion.hedged = hedged
+                if name != model:
+                    self._count(model, "fallback_won")
+                return completion
+        finally:
+            if token is not None:
+                cancel.unsubscribe(token)
+        if cancel is not None:
+            cancel.check()
+        real = [e for e in (errors.get(model), errors.get(fallback)) if e and not isinstance(e, HedgeCancelled)]
+        raise real[0] if real else errors[model]
+
+    def stats(self):
+        """One row per primary model that has run under the policy, for display."""
+        with self._lock:
+            counts = {model: dict(c) for model, c in self._counts.items()}
+        rows = []
+        for model, c in sorted(counts.items()):
+            rows.append({
+                "Model": model,
+                "Fallback": self.fallbacks.get(model),
+                "Threshold (s)": rounded(self.threshold(model)),
+                "Calls": c["calls"],
+                "Hedged": c["hedged"],
+                "Hedge %": rounded(100 * c["hedged"] / c["calls"], 1) if c["calls"] else None,
+                "Fallback answered": c["fallback_won"],
+            })
+        return rows
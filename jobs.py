@@ -0,0 +1,158 @@
+"""
+Background job executor
+Runs generations on a process-wide thread pool so the Streamlit script thread
+never blocks on the network. Each job lives in a shared table with its status,
+partial output and timing; pages poll the table by job id, which keeps results
+across reruns and lets users cancel in-flight work.
+"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import CancelScope
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+DEFAULT_WORKERS = 16
+# Finished jobs are dropped from the table after this many seconds
+DEFAULT_RETENTION = 6 * 3600
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work when the user cancelled it."""
+
+    def __init__(self, message="Cancelled by user"):
+        super().__init__(message)
+
+
+class Job:
+    """One unit of background work and everything the UI needs to show it."""
+
+    def __init__(self, job_id, label, meta=None):
+        self.id = job_id
+        self.label = label
+        self.meta = meta or {}
+        self.status = QUEUED
+        self.text = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        # Pass as `cancel` to client calls so cancel() aborts them mid-request
+        self.cancel_scope = CancelScope()
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATUSES
+
+    @property
+    def cancel_requested(self):
+        return self.cancel_scope.cancelled
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def check_cancelled(self):
+        """Call from inside the work at safe points; raises JobCancelled once cancel() was requested."""
+        self.cancel_scope.check()
+
+    def on_text(self, delta, text):
+        """Streaming callback: publish partial output and stop early when cancelled."""
+        self.text = text
+        self.check_cancelled()
+
+
+class JobManager:
+    """Thread pool plus a job table shared by every Streamlit session in the process."""
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, retention=DEFAULT_RETENTION):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kc-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def submit(self, work, label, **meta):
+        """
+        Run `work(job)` in the background and return the new job's id.
+
+        `work` should publish partial output on `job.text` (or pass
+        `job.on_text` as a streaming callback) and call `job.check_cancelled()`
+        between steps. Its return value becomes `job.result`.
+        """
+        with self._lock:
+            self._prune()
+            job = Job(f"job-{next(self._ids)}", label, meta)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, work)
+        return job.id
+
+    def _run(self, job, work):
+        if job.cancel_requested:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.result = work(job)
+            job.status = CANCELLED if job.cancel_requested else DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = e
+            job.status = CANCELLED if job.cancel_requested else FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, job_ids):
+        """Jobs for the given ids that still exist, in the given order."""
+        with self._lock:
+            return [self._jobs[i] for i in job_ids if i in self._jobs]
+
+    def cancel(self, job_id):
+        """
+        Request cancellation; queued jobs never start, calls made under the
+        job's cancel_scope are aborted and other work stops at its next check.
+        """
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel_scope.cancel(JobCancelled())
+        if job.future is not None and job.future.cancel():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    def counts(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {status: sum(1 for j in jobs if j.status == status)
+                for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [i for i, j in self._jobs.items() if not j.active and (j.finished_at or 0) < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self, wait=False):
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,275 @@
+"""
+Local stand-in for the OpenRouter chat-completions endpoint
+Lets batch throughput be tested offline without spending on API calls
+
+Run it and point the app at it:
+    python mock_server.py --port 8099 --latency 0.5
+    OPENROUTER_API_URL=http://127.0.0.1:8099/api/v1/chat/completions streamlit run app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUBJECT_PATTERN = re.compile(r'"([^"]+)"\s+(?:of|from)\s+"([^"]+)"')
+SECTION_PATTERN = re.compile(r'^## ([^:\n]+): ', re.MULTILINE)
+# Shortest prefix providers cache (OpenAI's automatic caching, Gemini Flash)
+MIN_CACHED_TOKENS = 1024
+
+# About 180 words, inside the templates' 150-250, so offline evaluation runs can pass
+PARAGRAPH_SENTENCES = [
+    "{name} is an established professional based in {place} with a long record of community involvement.",
+    "Their career reflects steady progression through leadership roles in regional business and civic life.",
+    "Public records and local coverage point to a reputation for reliability, discretion and long-term commitments.",
+    "They are known among peers for mentoring younger colleagues and supporting local education initiatives.",
+    "Engagement patterns suggest a preference for personal relationships over broad public campaigns.",
+    "Strategic outreach should emphasize measurable community impact and opportunities for hands-on involvement.",
+    "Recommended cultivation includes small briefings, invitations to leadership events and tailored stewardship.",
+    "Their background in {place} offers natural connections to regional institutions and professional networks.",
+    "Over time this profile indicates capacity for meaningful multi-year support of well-run organizations.",
+    "A thoughtful, relationship-first approach is most likely to result in sustained engagement.",
+    "Peers describe {name} as pragmatic, well-prepared and focused on outcomes rather than recognition.",
+    "Board service and volunteer leadership in {place} suggest comfort with governance and accountability.",
+    "An introduction through a trusted mutual contact would be the most natural first step.",
+]
+
+
+def mock_content(prompt):
+    """Produce a response that follows the templates' three-bullet + paragraph format."""
+    sections = SECTION_PATTERN.findall(prompt)
+    if sections:
+        # Combined dossier request: answer every section under its heading
+        return "\n\n".join(f"## {name}\n\n{mock_section(prompt)}" for name in sections)
+    return mock_section(prompt)
+
+
+def mock_section(prompt):
+    match = SUBJECT_PATTERN.search(prompt)
+    name, place = match.groups() if match else ("The prospect", "their area")
+    bullets = [
+        f"• Established presence in {place} with strong professional and civic ties",
+        f"• {name} shows consistent engagement with community organizations",
+        "• Profile indicates capacity for meaningful, relationship-driven support",
+    ]
+    paragraph = " ".join(s.format(name=name, place=place) for s in PARAGRAPH_SENTENCES)
+    return "\n".join(bullets) + "\n\n" + paragraph
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def message_text(message):
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": {"message": "Invalid JSON body", "code": 400}})
+            return
+
+        server = self.server
+        if server.error_rate and random.random() < server.error_rate:
+            self.send_rate_limited()
+            return
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+        messages = request.get("messages", [])
+        prompt = "\n".join(message_text(m) for m in messages)
+        content = mock_content(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and completion_tokens > max_tokens:
+            # Cut the answer off at the limit the way providers do
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = "length"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": server.cached_prefix_tokens(messages)},
+        }
+        if request.get("stream"):
+            self.send_stream(request.get("model", "mock/model"), content, usage, finish_reason)
+            return
+
+        # Generation time grows with output length, as it does for real models
+        time.sleep(server.token_latency * completion_tokens)
+
+        self.send_json(200, {
+            "id": f"gen-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock/model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        })
+
+    def send_rate_limited(self):
+        payload = json.dumps({"error": {"message": "Rate limit exceeded", "code": 429}}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("Retry-After", str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_stream(self, model, content, usage, finish_reason="stop"):
+        """Send the answer as OpenRouter-style server-sent events, a few words per chunk."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        response_id = f"gen-mock-{uuid.uuid4().hex[:12]}"
+
+        def event(delta, finish_reason=None, **extra):
+            chunk = {
+                "id": response_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            # Raw UTF-8 without a charset in the Content-Type, as real SSE streams are sent
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        words = re.findall(r"\S+\s*", content)
+        step = max(1, self.server.chunk_words)
+        for i in range(0, len(words), step):
+            event({"role": "assistant", "content": "".join(words[i:i + step])})
+            if self.server.token_interval:
+                time.sleep(self.server.token_interval)
+        event({}, finish_reason=finish_reason, usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.5, jitter=0.0, token_interval=0.02, chunk_words=4,
+                 token_latency=0.0, error_rate=0.0, retry_after=1, min_cached_tokens=MIN_CACHED_TOKENS,
+                 verbose=False):
+        super().__init__(address, MockHandler)
+        self.min_cached_tokens = min_cached_tokens
+        self.token_latency = token_latency
+        self.chunk_words = chunk_words
+        self.seen_prefixes = set()
+        self.prefix_lock = threading.Lock()
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.latency = latency
+        self.jitter = jitter
+        self.token_interval = token_interval
+        self.verbose = verbose
+
+    def cached_prefix_tokens(self, messages):
+        """
+        Simulate provider prefix caching: a repeated system message counts as
+        cached input once it is at least `min_cached_tokens` long.
+        """
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = message_text(messages[0])
+        if estimate_tokens(prefix) < self.min_cached_tokens:
+            return 0
+        with self.prefix_lock:
+            if prefix in self.seen_prefixes:
+                return estimate_tokens(prefix)
+            self.seen_prefixes.add(prefix)
+        return 0
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose when a call is cancelled
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+
+def start_mock_server(port=0, host="127.0.0.1", **options):
+    """Start a mock server on a daemon thread and return it; call shutdown() when done."""
+    server = MockServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenRouter chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.5, help="Base response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- delay added to latency")
+    parser.add_argument("--token-interval", type=float, default=0.02,
+                        help="Delay between streamed chunks in seconds")
+    parser.add_argument("--chunk-words", type=int, default=4, help="Words per streamed chunk")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Extra non-streamed delay per completion token in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 429 Too Many Requests")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--min-cached-tokens", type=int, default=MIN_CACHED_TOKENS,
+                        help="Shortest system prompt reported as cached when repeated")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), latency=args.latency, jitter=args.jitter,
+                        token_interval=args.token_interval, chunk_words=args.chunk_words,
+                        token_latency=args.token_latency,
+                        error_rate=args.error_rate,
+                        retry_after=args.retry_after, min_cached_tokens=args.min_cached_tokens,
+                        verbose=args.verbose)
+    print(f"Mock OpenRouter listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,616 @@
+"""
+OpenRouter chat-completions client
+Shared by the Streamlit UI and the batch runner so both send identical requests
+over one pooled, retrying HTTP session
+"""
+
+import email.utils
+import functools
+import json
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import requests
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from prompts import RenderedPrompt, render_prompt
+from scheduler import INTERACTIVE, estimate_tokens
+from telemetry import prompt_hash
+
+# Endpoint can be pointed at mock_server.py for offline testing
+OPENROUTER_URL = os.getenv(
+    "OPENROUTER_API_URL",
+    "https://openrouter.ai/api/v1/chat/completions"
+)
+
+MODELS = [
+    "google/gemini-2.5-flash",
+    "google/gemini-2.0-flash-001",
+    "google/gemini-3-pro-preview",
+    "google/gemini-2.5-pro",
+    "openai/gpt-4.1-mini",
+    "openai/gpt-5-mini",
+    "openai/gpt-4o-mini",
+    "openai/gpt-5",
+    "openai/gpt-4.1",
+    "x-ai/grok-code-fast-1",
+]
+
+# Approximate list prices in USD per million (input, output) tokens, used for cost estimates only
+MODEL_PRICING = {
+    "google/gemini-2.5-flash": (0.30, 2.50),
+    "google/gemini-2.0-flash-001": (0.10, 0.40),
+    "google/gemini-3-pro-preview": (2.00, 12.00),
+    "google/gemini-2.5-pro": (1.25, 10.00),
+    "openai/gpt-4.1-mini": (0.40, 1.60),
+    "openai/gpt-5-mini": (0.25, 2.00),
+    "openai/gpt-4o-mini": (0.15, 0.60),
+    "openai/gpt-5": (1.25, 10.00),
+    "openai/gpt-4.1": (2.00, 8.00),
+    "x-ai/grok-code-fast-1": (0.20, 1.50),
+}
+
+# Typical price of a cache-read input token relative to an uncached one
+CACHED_INPUT_PRICE_RATIO = 0.25
+
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 2048
+DEFAULT_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", 60))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", 10))
+DEFAULT_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", 3))
+DEFAULT_POOL_SIZE = 32
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+
+# Providers that only reuse a prompt prefix when it carries an explicit cache_control
+# breakpoint; OpenAI and xAI models cache long prefixes automatically
+CACHE_CONTROL_PROVIDERS = ("anthropic/", "google/")
+
+# Rate limits and transient upstream failures are worth another attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+@dataclass
+class Completion:
+    """A finished generation plus how long it took."""
+
+    data: dict
+    latency: float = 0.0
+    ttft: float = None
+    ttfb: float = None
+    cached: bool = False
+    attempts: int = 1
+    queue_wait: float = 0.0
+    coalesced: bool = False
+    max_tokens: int = None
+    model: str = None
+    hedged: bool = False
+
+    @property
+    def text(self):
+        return response_text(self.data)
+
+    @property
+    def usage(self):
+        return self.data.get("usage") or {}
+
+    @property
+    def cached_tokens(self):
+        """Input tokens served from the provider's prompt cache."""
+        return (self.usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+    @property
+    def finish_reason(self):
+        return self.data["choices"][0].get("finish_reason")
+
+
+class OpenRouterError(Exception):
+    """Raised when the API answers with a non-200 status."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def estimate_cost(model, usage):
+    """Estimated USD cost of a call from its `usage` block, or None for unknown models."""
+    if model not in MODEL_PRICING or not usage:
+        return None
+    input_price, output_price = MODEL_PRICING[model]
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    uncached = usage.get("prompt_tokens", 0) - cached
+    return (uncached * input_price + cached * input_price * CACHED_INPUT_PRICE_RATIO
+            + usage.get("completion_tokens", 0) * output_price) / 1_000_000
+
+
+def describe_error(error):
+    """User-facing message for the exceptions a generation can raise."""
+    if isinstance(error, OpenRouterError):
+        return f"API Error: {error}"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "Request timeout. The API took too long to respond."
+    if isinstance(error, requests.exceptions.RequestException):
+        return f"Request failed: {error}"
+    if isinstance(error, KeyError):
+        return f"Prompt formatting error: Missing variable {error}"
+    return str(error)
+
+
+def format_prompt(template, full_name, city, state):
+    """Fill the {full_name}, {city}, {state} variables of a prompt template."""
+    return render_prompt(template, full_name, city, state)
+
+
+def build_messages(model, prompt):
+    """
+    Chat messages for a prompt.
+
+    A RenderedPrompt becomes a system message holding the static prefix
+    (marked cacheable for providers that need explicit hints) followed by a
+    user message with the per-prospect suffix; a plain string is sent as a
+    single user message.
+    """
+    if not isinstance(prompt, RenderedPrompt):
+        return [{"role": "user", "content": str(prompt)}]
+    if not prompt.prefix or not prompt.suffix:
+        return [{"role": "user", "content": str(prompt)}]
+
+    system_content = prompt.prefix
+    if model.startswith(CACHE_CONTROL_PROVIDERS):
+        system_content = [{"type": "text", "text": prompt.prefix, "cache_control": {"type": "ephemeral"}}]
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": prompt.suffix},
+    ]
+
+
+def build_payload(model, prompt, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS,
+                  stream=False):
+    """Build the chat-completions request body for a prompt."""
+    payload = {
+        "model": model,
+        "messages": build_messages(model, prompt),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        # Ask OpenRouter for detailed usage, including cached prompt tokens
+        "usage": {"include": True},
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def build_headers(api_key):
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "HTTP-Referer": "https://localhost:3000",
+        "X-Title": "KC ProspectIQ Prompt Tester",
+    }
+
+
+def raise_for_api_error(response):
+    if response.status_code == 200:
+        return
+    try:
+        error_msg = response.json().get('error', {}).get('message', 'Unknown error')
+    except ValueError:
+        error_msg = response.text or 'Unknown error'
+    raise OpenRouterError(error_msg, response.status_code)
+
+
+# The cancellable call running on each thread, for the connection classes below
+_calls = threading.local()
+
+
+def shutdown_socket(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class CancellableCall:
+    """Sockets a call is reading from, subscribed to its CancelScope until the call ends."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.tokens = []
+
+    def watch(self, sock):
+        token = self.scope.subscribe(functools.partial(shutdown_socket, sock))
+        if token is not None:
+            self.tokens.append(token)
+
+    def close(self):
+        for token in self.tokens:
+            self.scope.unsubscribe(token)
+
+
+class CancellableConnectionMixin:
+    """Lets the calling thread's CancelScope shut the socket down while the answer is awaited and read."""
+
+    def getresponse(self):
+        call = getattr(_calls, "current", None)
+        if call is not None and self.sock is not None:
+            call.watch(self.sock)
+        return super().getresponse()
+
+
+class CancellableHTTPConnection(CancellableConnectionMixin, HTTPConnection):
+    pass
+
+
+class CancellableHTTPSConnection(CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CancellableHTTPConnection
+
+
+class CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CancellableHTTPSConnection
+
+
+class CancellableAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter whose in-flight requests can be aborted from another thread."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CancellableHTTPConnectionPool,
+            "https": CancellableHTTPSConnectionPool,
+        }
+
+
+@contextmanager
+def cancellable(cancel):
+    """
+    Run the requests made in the block so that cancelling the CancelScope
+    `cancel` shuts their sockets down, even before the first byte arrives.
+
+    The block then raises the scope's error rather than whatever the aborted
+    read raised (an aborted stream can also end as if it were complete).
+    """
+    if cancel is None:
+        yield
+        return
+    cancel.check()
+    call = _calls.current = CancellableCall(cancel)
+    try:
+        yield
+    except Exception as e:
+        if cancel.cancelled:
+            raise cancel.error from e
+        raise
+    finally:
+        _calls.current = None
+        call.close()
+    cancel.check()
+
+
+class OpenRouterClient:
+    """
+    Shared OpenRouter client with a pooled keep-alive session and retries.
+
+    Create one per process and reuse it from every thread: the underlying
+    requests.Session keeps TLS connections open between calls. 429 and 5xx
+    answers and connection failures are retried with jittered exponential
+    backoff, honouring Retry-After when the API sends it. When a
+    TelemetryStore is given every call, successful or not, is recorded in it.
+    When a Scheduler is given every call first waits for rate-limit budget,
+    and 429s pause the provider for every caller sharing that scheduler.
+    Calls given a CancelScope as `cancel` are aborted as soon as it is cancelled.
+    """
+
+    def __init__(self, api_key, url=None, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_TIMEOUT,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_cap=DEFAULT_BACKOFF_CAP, telemetry=None, scheduler=None):
+        self.api_key = api_key
+        self.telemetry = telemetry
+        self.scheduler = scheduler
+        self.url = url or OPENROUTER_URL
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.session = requests.Session()
+        self.session.headers.update(build_headers(api_key))
+        adapter = CancellableAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def backoff_delay(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def post(self, payload, stream=False, connect_timeout=None, read_timeout=None, cancel=None):
+        """
+        POST a chat-completions payload, retrying transient failures.
+
+        Returns (response, attempts, sent_at) for a 200 answer, where `sent_at`
+        is the perf_counter() time the final attempt was sent. Raises
+        OpenRouterError once retries are exhausted or the error is not
+        retryable; raised exceptions carry the attempt count in `attempts`.
+        A cancelled `cancel` scope stops the retries.
+        """
+        timeout = (connect_timeout or self.connect_timeout, read_timeout or self.read_timeout)
+        attempt = 0
+        while True:
+            attempt += 1
+            if cancel is not None:
+                cancel.check()
+            sent_at = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.RequestException as e:
+                # Read timeouts are not retried: the provider may already be billing the request
+                if (not isinstance(e, requests.exceptions.ConnectionError) or attempt > self.max_retries
+                        or (cancel is not None and cancel.cancelled)):
+                    e.attempts = attempt
+                    raise
+                self.sleep(self.backoff_delay(attempt), cancel)
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt <= self.max_retries:
+                delay = self.backoff_delay(attempt, response)
+                response.close()
+                if response.status_code == 429 and self.scheduler is not None:
+                    self.scheduler.pause(payload["model"], delay)
+                self.sleep(delay, cancel)
+                continue
+
+            if response.status_code != 200:
+                with response:
+                    try:
+                        raise_for_api_error(response)
+                    except OpenRouterError as e:
+                        e.attempts = attempt
+                        raise
+            return response, attempt, sent_at
+
+    def sleep(self, seconds, cancel=None):
+        if cancel is None:
+            time.sleep(seconds)
+        else:
+            cancel.wait(seconds)
+
+    def admit(self, model, prompt, max_tokens, priority, cancel=None):
+        """Wait for rate-limit budget; returns a scheduler ticket, or None without a scheduler."""
+        if self.scheduler is None:
+            return None
+        return self.scheduler.acquire(model, estimate_tokens(str(prompt)) + max_tokens, priority, cancel=cancel)
+
+    def release(self, ticket, completion=None):
+        """Refund the part of the admitted token estimate a call did not use; all of it if the call failed."""
+        if ticket is None:
+            return
+        if completion is None:
+            self.scheduler.release(ticket, 0)
+            return
+        usage = completion.usage
+        used = (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+        self.scheduler.release(ticket, used or None)
+
+    def record_call(self, model, prompt, category, start, queue_wait, completion=None, error=None,
+                    max_tokens=None, cancelled=False):
+        """Append one call to the telemetry store, if there is one; `cancelled` calls are not errors."""
+        if self.telemetry is None:
+            return
+        record = {
+            "model": model,
+            "category": category,
+            "prompt_hash": prompt_hash(str(prompt)),
+            "queue_wait": round(queue_wait, 4),
+            "max_tokens": max_tokens,
+        }
+        if completion is not None:
+            usage = completion.usage
+            record.update(
+                status_code=200,
+                ttfb=round(completion.ttfb, 4) if completion.ttfb is not None else None,
+                ttft=round(completion.ttft, 4) if completion.ttft is not None else None,
+                latency=round(completion.latency, 4),
+                prompt_tokens=usage.get("prompt_tokens"),
+                cached_tokens=completion.cached_tokens,
+                completion_tokens=usage.get("completion_tokens"),
+                finish_reason=completion.finish_reason,
+                attempts=completion.attempts,
+            )
+        elif cancelled:
+            record.update(
+                status="cancelled",
+                latency=round(time.perf_counter() - start, 4),
+                error=describe_error(error),
+            )
+        else:
+            record.update(
+                status_code=getattr(error, "status_code", None),
+                latency=round(time.perf_counter() - start, 4),
+                attempts=getattr(error, "attempts", 1),
+                error=describe_error(error),
+            )
+        self.telemetry.record(**record)
+
+    def chat_completion(self, model, prompt, temperature=DEFAULT_TEMPERATURE,
+                        max_tokens=DEFAULT_MAX_TOKENS, connect_timeout=None, read_timeout=None,
+                        category=None, queued_at=None, priority=INTERACTIVE, cancel=None):
+        """
+        Send one prompt and return a Completion.
+
+        Raises OpenRouterError for API errors; requests exceptions (timeouts,
+        connection failures) are left for the caller to handle. `category` and
+        `queued_at` (a perf_counter() timestamp) only feed telemetry; queue
+        wait includes time spent waiting on the scheduler at `priority`.
+        Cancelling the CancelScope `cancel` aborts the request, or its wait for
+        rate-limit budget, and raises the scope's error.
+        """
+        entered = time.perf_counter()
+        ticket = self.admit(model, prompt, max_tokens, priority, cancel)
+        start = time.perf_counter()
+        queue_wait = start - (queued_at or entered)
+        try:
+            with cancellable(cancel):
+                response, attempts, sent_at = self.post(
+                    build_payload(model, prompt, temperature, max_tokens),
+                    connect_timeout=connect_timeout, read_timeout=read_timeout, cancel=cancel
+                )
+                data = response.json()
+            completion = Completion(
+                data,
+                latency=time.perf_counter() - start,
+                ttfb=sent_at - start + response.elapsed.total_seconds(),
+                attempts=attempts,
+                queue_wait=queue_wait,
+                max_tokens=max_tokens,
+                model=model,
+            )
+        except Exception as e:
+            self.release(ticket)
+            self.record_call(model, prompt, category, start, queue_wait, error=e, max_tokens=max_tokens,
+                             cancelled=cancel is not None and cancel.cancelled)
+            raise
+        self.release(ticket, completion)
+        self.record_call(model, prompt, category, start, queue_wait, completion=completion,
+                         max_tokens=max_tokens)
+        return completion
+
+    def stream_chat_completion(self, model, prompt, temperature=DEFAULT_TEMPERATURE,
+                               max_tokens=DEFAULT_MAX_TOKENS, connect_timeout=None, read_timeout=None,
+                               on_text=None, category=None, queued_at=None, priority=INTERACTIVE,
+                               cancel=None):
+        """
+        Send one prompt with `stream: true` and assemble the answer as it arrives.
+
+        `on_text(delta, text_so_far)` is called for every content chunk. Returns a
+        Completion whose data has the same shape as a non-streamed response, with
+        time-to-first-token recorded in `ttft`. Errors reported mid-stream raise
+        OpenRouterError; the read timeout bounds both the wait between chunks and
+        the whole stream. Only failures before the stream starts are retried.
+        Cancelling the CancelScope `cancel` aborts the stream, even before its
+        first chunk or while waiting for rate-limit budget, and raises the
+        scope's error.
+        """
+        entered = time.perf_counter()
+        ticket = self.admit(model, prompt, max_tokens, priority, cancel)
+        start = time.perf_counter()
+        queue_wait = start - (queued_at or entered)
+        try:
+            with cancellable(cancel):
+                completion = self._stream(model, prompt, temperature, max_tokens, connect_timeout,
+                                          read_timeout, on_text, start, cancel)
+        except Exception as e:
+            self.release(ticket)
+            self.record_call(model, prompt, category, start, queue_wait, error=e, max_tokens=max_tokens,
+                             cancelled=cancel is not None and cancel.cancelled)
+            raise
+        completion.queue_wait = queue_wait
+        completion.max_tokens = max_tokens
+        completion.model = model
+        self.release(ticket, completion)
+        self.record_call(model, prompt, category, start, queue_wait, completion=completion,
+                         max_tokens=max_tokens)
+        return completion
+
+    def _stream(self, model, prompt, temperature, max_tokens, connect_timeout, read_timeout, on_text, start,
+                cancel=None):
+        read_timeout = read_timeout or self.read_timeout
+        ttft = None
+        parts = []
+        finish_reason = None
+        usage = None
+        response_id = None
+        response_model = model
+
+        response, attempts, _ = self.post(
+            build_payload(model, prompt, temperature, max_tokens, stream=True),
+            stream=True, connect_timeout=connect_timeout, read_timeout=read_timeout, cancel=cancel
+        )
+        ttfb = time.perf_counter() - start
+        with response:
+            try:
+                for chunk in iter_sse_events(response):
+                    if 'error' in chunk:
+                        error = chunk['error']
+                        raise OpenRouterError(error.get('message', 'Unknown error'), error.get('code'))
+
+                    response_id = chunk.get('id', response_id)
+                    response_model = chunk.get('model', response_model)
+                    usage = chunk.get('usage') or usage
+                    for choice in chunk.get('choices', []):
+                        finish_reason = choice.get('finish_reason') or finish_reason
+                        delta = (choice.get('delta') or {}).get('content')
+                        if delta:
+                            if ttft is None:
+                                ttft = time.perf_counter() - start
+                            parts.append(delta)
+                            if on_text:
+                                on_text(delta, "".join(parts))
+
+                    if time.perf_counter() - start > read_timeout:
+                        raise requests.exceptions.Timeout("Stream exceeded the request timeout")
+            except requests.exceptions.ConnectionError as e:
+                # urllib3 surfaces a stalled stream as a connection error
+                if 'timed out' in str(e):
+                    raise requests.exceptions.Timeout(str(e)) from e
+                raise
+
+        data = {
+            "id": response_id,
+            "model": response_model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(parts)},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage,
+        }
+        return Completion(data, latency=time.perf_counter() - start, ttft=ttft, ttfb=ttfb, attempts=attempts)
+
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def iter_sse_events(response):
+    """Yield decoded JSON payloads from a server-sent-events response until [DONE]."""
+    # SSE is always UTF-8; without a charset requests would fall back to ISO-8859-1
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        # Blank lines separate events; lines starting with ':' are keep-alive comments
+        if not line or line.startswith(':') or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        yield json.loads(data)
+
+
+def response_text(data):
+    """Extract the assistant message from a chat-completions response."""
+    return data['choices'][0]['message']['content']
@@ -3,6 +3,10 @@ AI Prompts for Knowledge Core IQ Search
 Extracted from the main application for testing and modification
 """
 
+from functools import lru_cache
+from string import Formatter
+from typing import NamedTuple
+
 PROFILE_PROMPT = '''Create a professional biography for "{full_name}" of "{city}, {state}".
 
 CRITICAL: Your response must ONLY contain the final formatted biography. Do not include research notes, reasoning, or drafts.
@@ -222,3 +226,56 @@ CATEGORY_PROMPTS = {
     'Social Media': SOCIAL_MEDIA_PROMPT,
     'News': NEWS_PROMPT
 }
+
+
+# Prompt-prefix caching
+# Providers can only reuse a cached prompt prefix if it is byte-identical across
+# calls, so each template is split into its static instructions (sent first, as a
+# system message) and the short paragraphs that mention the prospect (sent last).
+#
+# Providers only cache prefixes of about 1024 tokens or more (OpenAI's automatic
+# caching, Gemini Flash). The default templates' prefixes are 500-630 tokens, so
+# they are not cached yet; a template needs roughly 4,000 characters of static
+# instructions before the split pays off.
+
+PROSPECT_FIELDS = ('full_name', 'city', 'state')
+
+
+class RenderedPrompt(NamedTuple):
+    """A formatted prompt split into a cacheable prefix and a per-prospect suffix."""
+    prefix: str
+    suffix: str
+
+    def __str__(self):
+        return "\n\n".join(part for part in (self.suffix, self.prefix) if part)
+
+
+def has_prospect_fields(text):
+    try:
+        return any(field in PROSPECT_FIELDS for _, field, _, _ in Formatter().parse(text) if field)
+    except ValueError:
+        # Malformed braces: keep the paragraph dynamic so str.format() reports it
+        return True
+
+
+@lru_cache(maxsize=256)
+def split_prompt(template):
+    """
+    Split a template into (static prefix, dynamic suffix) by paragraph.
+
+    Paragraphs that use {full_name}, {city} or {state} form the suffix; all
+    other paragraphs keep their order in the prefix. Cached, since the same
+    few templates are rendered for every prospect and rerun.
+    """
+    paragraphs = template.strip().split("\n\n")
+    prefix = [p for p in paragraphs if not has_prospect_fields(p)]
+    suffix = [p for p in paragraphs if has_prospect_fields(p)]
+    return "\n\n".join(prefix), "\n\n".join(suffix)
+
+
+def render_prompt(template, full_name, city, state):
+    """Format a template for one prospect; raises KeyError for unknown variables."""
+    prefix, suffix = split_prompt(template)
+    fields = {'full_name': full_name, 'city': city, 'state': state}
+    return RenderedPrompt(prefix.format(**fields), suffix.format(**fields))
+
@@ -0,0 +1,185 @@
+"""
+Headless research API
+Runs a category prompt for one prospect and returns the answer with its usage
+and timing, without Streamlit, so cron jobs, pipelines and the CLI can use the
+same client, cache, rate limiter and request sharing as the app.
+
+    from research import Prospect, Researcher
+    researcher = Researcher.from_env()
+    result = researcher.research(Prospect("John", "Smith", "Phoenix", "AZ"), "Profile")
+    print(result.text, result.usage, result.latency)
+"""
+
+import asyncio
+import os
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+import requests
+
+from generation import complete
+from openrouter import (
+    DEFAULT_TEMPERATURE,
+    MODELS,
+    OpenRouterClient,
+    OpenRouterError,
+    describe_error,
+    format_prompt,
+)
+from prompts import CATEGORY_PROMPTS
+
+DEFAULT_MODEL = MODELS[0]
+
+
+class Prospect(NamedTuple):
+    """The person being researched."""
+
+    first_name: str
+    last_name: str
+    city: str
+    state: str
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}".strip()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a mapping with first_name, last_name, city and state (e.g. a batch CSV row)."""
+        return cls(*(str(data.get(f, "")).strip() for f in cls._fields))
+
+
+@dataclass
+class ResearchResult:
+    """Outcome of one research call; `error` is set instead of `text` when it failed."""
+
+    prospect: Prospect
+    category: str
+    model: str
+    text: str = ""
+    usage: dict = field(default_factory=dict)
+    latency: float = 0.0
+    ttft: float = None
+    queue_wait: float = 0.0
+    cached: bool = False
+    coalesced: bool = False
+    finish_reason: str = None
+    max_tokens: int = None
+    answered_by: str = None
+    hedged: bool = False
+    error: str = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__dataclass_fields__}
+        data["prospect"] = self.prospect._asdict()
+        return data
+
+
+class Researcher:
+    """
+    Owns an OpenRouterClient plus the optional response cache, SingleFlight
+    table, AdaptiveLimits for max_tokens and HedgePolicy for slow models.
+
+    Safe to share between threads. Use from_env() for the same setup as the
+    app (telemetry, rate limiting, on-disk cache), or pass existing pieces in.
+    """
+
+    def __init__(self, client, cache=None, flights=None, limits=None, hedging=None):
+        self.client = client
+        self.cache = cache
+        self.flights = flights
+        self.limits = limits
+        self.hedging = hedging
+
+    @classmethod
+    def from_env(cls, api_key=None, url=None, use_cache=True):
+        """Build a Researcher from OPENROUTER_API_KEY (read from .env if present) with default stores."""
+        from dotenv import load_dotenv
+        from coalesce import SingleFlight
+        from hedging import HedgePolicy
+        from response_cache import ResponseCache
+        from scheduler import Scheduler
+        from telemetry import TelemetryStore
+        from token_limits import AdaptiveLimits
+
+        load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+        api_key = api_key or os.getenv("OPENROUTER_API_KEY", "")
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not found in environment variables.")
+        telemetry = TelemetryStore()
+        client = OpenRouterClient(api_key, url=url, telemetry=telemetry, scheduler=Scheduler())
+        return cls(client, cache=ResponseCache() if use_cache else None, flights=SingleFlight(),
+                   limits=AdaptiveLimits(telemetry), hedging=HedgePolicy(telemetry))
+
+    def complete(self, model, prompt, temperature=DEFAULT_TEMPERATURE, max_tokens=None,
+                 bypass_cache=False, stream=False, on_text=None, hedge=False, **kwargs):
+        """
+        Send an already rendered prompt and return the Completion.
+
+        Goes through the cache and request sharing; API and network errors
+        are raised. Without `max_tokens` the limit adapts to past answers for
+        the same category and model. With `hedge` a slow model is raced
+        against its fallback. Extra keyword arguments (timeouts, category,
+        priority) are passed to the client.
+        """
+        return complete(
+            self.client, model, prompt, temperature, max_tokens, cache=self.cache, bypass_cache=bypass_cache,
+            stream=stream, on_text=on_text, flights=self.flights, limits=self.limits,
+            hedge=self.hedging if hedge else None, **kwargs
+        )
+
+    def research(self, prospect, category=None, template=None, model=DEFAULT_MODEL,
+                 temperature=DEFAULT_TEMPERATURE, max_tokens=None, bypass_cache=False,
+                 stream=False, on_text=None, **kwargs):
+        """
+        Run one category prompt (or a custom `template`) for `prospect`.
+
+        `prospect` is a Prospect or a mapping with the same fields. Failures
+        are reported in the result's `error` rather than raised.
+        """
+        if not isinstance(prospect, Prospect):
+            prospect = Prospect.from_dict(prospect)
+        if template is None:
+            if category not in CATEGORY_PROMPTS:
+                raise ValueError(f"Unknown category {category!r}; expected one of {list(CATEGORY_PROMPTS)}")
+            template = CATEGORY_PROMPTS[category]
+        result = ResearchResult(prospect, category or "Custom", model)
+        try:
+            prompt = format_prompt(template, prospect.full_name, prospect.city, prospect.state)
+            completion = self.complete(
+                model, prompt, temperature, max_tokens, bypass_cache=bypass_cache, stream=stream,
+                on_text=on_text, category=result.category, **kwargs
+            )
+        except (KeyError, OpenRouterError, requests.exceptions.RequestException) as e:
+            result.error = describe_error(e)
+            return result
+        result.text = completion.text
+        result.usage = completion.usage
+        result.latency = completion.latency
+        result.ttft = completion.ttft
+        result.queue_wait = completion.queue_wait
+        result.cached = completion.cached
+        result.coalesced = completion.coalesced
+        result.finish_reason = completion.finish_reason
+        result.max_tokens = completion.max_tokens
+        result.answered_by = completion.model
+        result.hedged = completion.hedged
+        return result
+
+    async def aresearch(self, prospect, category=None, template=None, model=DEFAULT_MODEL, **kwargs):
+        """research() for asyncio code; runs the blocking call on the default executor."""
+        return await asyncio.to_thread(self.research, prospect, category, template, model, **kwargs)
+
+    async def aresearch_many(self, prospect, categories=None, model=DEFAULT_MODEL, **kwargs):
+        """Run several categories (default: all) for one prospect concurrently; returns results in order."""
+        categories = list(categories or CATEGORY_PROMPTS)
+        return await asyncio.gather(*(self.aresearch(prospect, c, model=model, **kwargs) for c in categories))
+
+    def close(self):
+        self.client.close()
+        if self.cache is not None:
+            self.cache.close()
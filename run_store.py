@@ -0,0 +1,154 @@
+"""
+Resumable run store
+Writes batch results to rotating JSONL chunks in a run directory and keeps a
+SQLite checkpoint index of completed (prospect, category, model) keys, so an
+interrupted run picks up where it stopped without re-reading its output and
+without holding results in memory.
+
+    runs/overnight/
+        checkpoint.sqlite3
+        results-00001.jsonl
+        results-00002.jsonl
+        ...
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CHECKPOINT_NAME = "checkpoint.sqlite3"
+CHUNK_PATTERN = "results-{:05d}.jsonl"
+DEFAULT_CHUNK_BYTES = 16 * 1024 * 1024
+# The index is committed every this many records or seconds, whichever comes first
+COMMIT_EVERY = 200
+COMMIT_INTERVAL = 2.0
+
+
+def task_key(prospect, category, model):
+    """Compact, stable key of one unit of work."""
+    material = "\x1f".join([prospect["first_name"], prospect["last_name"], prospect["city"],
+                            prospect["state"], category, model])
+    return hashlib.sha256(material.lower().encode("utf-8")).hexdigest()[:24]
+
+
+class RunStore:
+    """
+    Append-only result chunks plus a checkpoint index for one run directory.
+
+    A key counts as done once its record is written and the index committed.
+    A crash between the two means that record is redone on restart, so a
+    chunk may hold the same key twice; read() keeps the last one. Failed
+    records are retried on restart unless `retry_failed` is False.
+    """
+
+    def __init__(self, directory, chunk_bytes=DEFAULT_CHUNK_BYTES, retry_failed=True):
+        self.directory = directory
+        self.chunk_bytes = chunk_bytes
+        self.retry_failed = retry_failed
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(os.path.join(directory, CHECKPOINT_NAME), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS done ("
+            "key TEXT PRIMARY KEY, status TEXT NOT NULL, chunk INTEGER NOT NULL, finished_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._uncommitted = 0
+        self._committed_at = time.monotonic()
+
+        chunks = self.chunk_paths()
+        self._chunk = len(chunks) or 1
+        self._out = open(self.chunk_path(self._chunk), "a", encoding="utf-8")
+        if self._out.tell() and not self._ends_with_newline():
+            # Terminate a line left half-written by a crash so the next record starts cleanly
+            self._out.write("\n")
+            self._out.flush()
+
+    def _ends_with_newline(self):
+        with open(self.chunk_path(self._chunk), "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def chunk_path(self, number):
+        return os.path.join(self.directory, CHUNK_PATTERN.format(number))
+
+    def chunk_paths(self):
+        return sorted(glob.glob(os.path.join(self.directory, CHUNK_PATTERN.replace("{:05d}", "[0-9]" * 5))))
+
+    def is_done(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM done WHERE key = ?", (key,)).fetchone()
+        return row is not None and (row[0] == "ok" or not self.retry_failed)
+
+    def append(self, key, record):
+        """Write one finished record and mark its key done."""
+        line = json.dumps({"key": key, **record}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._out.tell() and self._out.tell() + len(line) > self.chunk_bytes:
+                self._out.close()
+                self._chunk += 1
+                self._out = open(self.chunk_path(self._chunk), "a", encoding="utf-8")
+            self._out.write(line)
+            self._out.flush()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO done (key, status, chunk, finished_at) VALUES (?, ?, ?, ?)",
+                (key, record.get("status", "ok"), self._chunk, time.time())
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY or time.monotonic() - self._committed_at > COMMIT_INTERVAL:
+                self._commit()
+
+    def _commit(self):
+        os.fsync(self._out.fileno())
+        self._conn.commit()
+        self._uncommitted = 0
+        self._committed_at = time.monotonic()
+
+    def counts(self):
+        """{status: number of keys} from the index."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM done GROUP BY status").fetchall())
+
+    def read(self):
+        """
+        Yield every stored record, chunk by chunk.
+
+        Duplicates from a redone key are skipped in favour of the later
+        record using the index, so memory stays bounded by one chunk.
+        """
+        with self._lock:
+            self._out.flush()
+        for number, path in enumerate(self.chunk_paths(), start=1):
+            with open(path, encoding="utf-8") as f:
+                records = {}
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A partially written last line from a crashed process
+                        continue
+                    records[record["key"]] = record
+            keys = list(records)
+            latest = {}
+            with self._lock:
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    latest.update(self._conn.execute(
+                        f"SELECT key, chunk FROM done WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall())
+            for key, record in records.items():
+                if latest.get(key, number) == number:
+                    yield record
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._out.close()
+            self._conn.close()
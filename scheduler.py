@@ -0,0 +1,223 @@
+"""
+Shared rate limiter and priority scheduler
+One process-wide scheduler keeps every Streamlit session and batch run inside
+the requests-per-minute and tokens-per-minute budgets of each model and
+provider. Interactive requests are admitted ahead of bulk work, and a 429 from
+a provider pauses everyone's traffic to it instead of triggering a retry storm.
+
+Budgets can be overridden with the KC_RATE_LIMITS environment variable, e.g.
+    KC_RATE_LIMITS='{"openai": {"rpm": 500, "tpm": 800000}, "openai/gpt-5": {"rpm": 100}}'
+Keys containing "/" are models, anything else is a provider.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+INTERACTIVE = 0
+BULK = 10
+
+DEFAULT_PROVIDER_LIMIT = {"rpm": 300, "tpm": 1_000_000}
+DEFAULT_MODEL_LIMIT = {"rpm": 120, "tpm": 400_000}
+
+# How long wait times are remembered for the UI
+WAIT_WINDOW = 300
+# Upper bound on the wait samples kept for stats(), whatever the request rate
+MAX_WAIT_SAMPLES = 10_000
+
+
+def provider_of(model):
+    return model.split("/", 1)[0]
+
+
+def estimate_tokens(text):
+    """Rough prompt size: about four characters per token."""
+    return len(text) // 4 + 1
+
+
+def load_limits():
+    raw = os.getenv("KC_RATE_LIMITS")
+    return json.loads(raw) if raw else {}
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding at most one minute of budget."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` can be taken (0 if available now)."""
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Budget:
+    """RPM and TPM buckets for one model or provider, plus an optional pause after a 429."""
+
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+
+    def wait_time(self, tokens, now):
+        return max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def take(self, tokens):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+
+class Ticket:
+    """Admission record returned by Scheduler.acquire(); pass it back to release()."""
+
+    def __init__(self, model, tokens, priority, waited):
+        self.model = model
+        self.tokens = tokens
+        self.priority = priority
+        self.waited = waited
+
+
+class Scheduler:
+    """
+    Token-bucket admission control shared by all callers in the process.
+
+    acquire() blocks until the model's and its provider's budgets can cover
+    one more request of the estimated size. Among callers waiting on the same
+    provider, lower `priority` values go first, then arrival order.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = load_limits() if limits is None else limits
+        self._budgets = {}
+        self._waiting = []
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=MAX_WAIT_SAMPLES)
+        self.admitted = 0
+
+    def budget(self, key):
+        """Budget for a model ("provider/name") or provider key, created on first use."""
+        budget = self._budgets.get(key)
+        if budget is None:
+            default = DEFAULT_MODEL_LIMIT if "/" in key else DEFAULT_PROVIDER_LIMIT
+            limit = {**default, **self.limits.get(key, {})}
+            budget = self._budgets[key] = Budget(key, limit["rpm"], limit["tpm"])
+        return budget
+
+    def acquire(self, model, tokens, priority=INTERACTIVE, timeout=None, cancel=None):
+        """
+        Block until a request for `model` needing `tokens` may be sent.
+
+        Raises TimeoutError if `timeout` seconds pass first, and the scope's
+        error as soon as the CancelScope `cancel` is cancelled.
+        """
+        start = time.monotonic()
+        provider = provider_of(model)
+        entry = (priority, next(self._order), provider)
+        token = cancel.subscribe(self._wake) if cancel is not None else None
+        with self._cond:
+            self._waiting.append(entry)
+            try:
+                while True:
+                    if cancel is not None:
+                        cancel.check()
+                    now = time.monotonic()
+                    budgets = (self.budget(model), self.budget(provider))
+                    ahead = any(other < entry and other[2] == provider for other in self._waiting)
+                    delay = max(b.wait_time(tokens, now) for b in budgets)
+                    if not ahead and delay <= 0:
+                        for b in budgets:
+                            b.take(tokens)
+                        break
+                    if timeout is not None and now - start + delay > timeout:
+                        raise TimeoutError(f"Rate limit queue wait for {model} exceeded {timeout}s")
+                    # Wake when budget refills, or earlier if someone ahead leaves the queue
+                    self._cond.wait(delay if not ahead and delay > 0 else 1.0)
+            finally:
+                self._waiting.remove(entry)
+                self._cond.notify_all()
+                if token is not None:
+                    cancel.unsubscribe(token)
+
+            waited = time.monotonic() - start
+            self.admitted += 1
+            self._waits.append((time.time(), waited, priority))
+            self._prune_waits()
+        return Ticket(model, tokens, priority, waited)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def release(self, ticket, used_tokens=None):
+        """Return unused token budget once the real usage of a call is known."""
+        if used_tokens is None or used_tokens >= ticket.tokens:
+            return
+        with self._cond:
+            refund = ticket.tokens - used_tokens
+            self.budget(ticket.model).tokens.give_back(refund)
+            self.budget(provider_of(ticket.model)).tokens.give_back(refund)
+            self._cond.notify_all()
+
+    def pause(self, model, seconds):
+        """Hold all traffic to the model's provider, e.g. after a 429 with Retry-After."""
+        with self._cond:
+            budget = self.budget(provider_of(model))
+            budget.paused_until = max(budget.paused_until, time.monotonic() + seconds)
+
+    def _prune_waits(self):
+        cutoff = time.time() - WAIT_WINDOW
+        while self._waits and self._waits[0][0] < cutoff:
+            self._waits.popleft()
+
+    def stats(self):
+        """Queue depth and recent wait times for display."""
+        with self._cond:
+            self._prune_waits()
+            waits = [w for _, w, _ in self._waits]
+            return {
+                "waiting": len(self._waiting),
+                "waiting_bulk": sum(1 for p, _, _ in self._waiting if p >= BULK),
+                "admitted": self.admitted,
+                "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+                "max_wait": max(waits) if waits else 0.0,
+            }
+
+    def budgets(self):
+        """Current fill level of every budget seen so far."""
+        now = time.monotonic()
+        with self._cond:
+            rows = []
+            for key, budget in sorted(self._budgets.items()):
+                budget.requests.refill(now)
+                budget.tokens.refill(now)
+                rows.append({
+                    "Budget": key,
+                    "Requests left": int(budget.requests.tokens),
+                    "RPM": int(budget.requests.capacity),
+                    "Tokens left": int(budget.tokens.tokens),
+                    "TPM": int(budget.tokens.capacity),
+                    "Paused (s)": round(max(0.0, budget.paused_until - now), 1),
+                })
+            return rows
@@ -0,0 +1,448 @@
+"""
+Per-call latency and token telemetry
+Every OpenRouter call made through OpenRouterClient is appended as one JSON
+line to a local file, rotated once it grows past KC_TELEMETRY_MAX_MB;
+summarize() turns those records into p50/p95/p99 latency and throughput per
+model and category, and CallSummary keeps the same figures up to date for the
+dashboard without re-reading the log
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+DEFAULT_TELEMETRY_PATH = os.getenv(
+    "KC_TELEMETRY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "telemetry.jsonl")
+)
+# The log is rotated past this size, keeping one backup
+DEFAULT_MAX_BYTES = int(float(os.getenv("KC_TELEMETRY_MAX_MB", 64)) * 1024 * 1024)
+# Seconds between reads of new lines from the log
+DEFAULT_REFRESH = 10
+# Seconds between recomputing a RollingWindow summary, which goes over every sample
+SUMMARY_INTERVAL = 60
+# Dashboard aggregates are kept in slices of this many seconds, for this long
+DEFAULT_BUCKET = 600
+DEFAULT_RETENTION = 30 * 24 * 3600
+# Successful calls sampled per group for latency percentiles
+MAX_SAMPLES = 2000
+
+
+def prompt_hash(prompt):
+    """Short, stable identifier for a rendered prompt."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0-100) of a list of numbers, or None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class TelemetryStore:
+    """
+    Append-only JSONL store of call records, safe to share between threads.
+
+    Once the log grows past `max_bytes` it is rotated to `<path>.1`,
+    replacing the previous backup, so at most about twice that is kept.
+    """
+
+    def __init__(self, path=DEFAULT_TELEMETRY_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.backup_path = path + ".1"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._tail = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def record(self, **fields):
+        fields.setdefault("ts", time.time())
+        line = json.dumps(fields) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                size = f.tell()
+            if self.max_bytes and size > self.max_bytes:
+                os.replace(self.path, self.backup_path)
+
+    def read(self, since=None):
+        """Yield stored records, oldest first, optionally only those newer than the `since` timestamp."""
+        for path in (self.backup_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A partially written last line from a crashed process
+                        continue
+                    if since is None or record.get("ts", 0) >= since:
+                        yield record
+
+    def read_new(self, position=None):
+        """
+        Records appended since `position`, as (records, next_position, restarted).
+
+        With `position=None` everything still on disk is read: the backup,
+        then the current log. Only complete lines are consumed, so a line
+        still being written is picked up by the next call. Lines left in a log
+        that was rotated since the last call are read from the backup. If the
+        log was cleared or replaced, everything is read again and `restarted`
+        is True.
+        """
+        records = []
+        current = _open_log(self.path)
+        backup = _open_log(self.backup_path)
+        try:
+            inode = os.fstat(current.fileno()).st_ino if current else None
+            backup_inode = os.fstat(backup.fileno()).st_ino if backup else None
+            offset = 0
+            restarted = False
+            if position is not None and current and position[0] == inode \
+                    and os.fstat(current.fileno()).st_size >= position[1]:
+                offset = position[1]
+            elif position is not None and backup and position[0] == backup_inode:
+                # Rotated since the last call: finish the old log first
+                _read_lines(backup, position[1], records)
+            else:
+                restarted = position is not None and position[0] is not None
+                if backup:
+                    _read_lines(backup, 0, records)
+            if current:
+                offset = _read_lines(current, offset, records)
+            return records, (inode, offset), restarted
+        finally:
+            for f in (current, backup):
+                if f:
+                    f.close()
+
+    def tail(self):
+        """The TelemetryTail shared by everything that follows this store."""
+        with self._lock:
+            if self._tail is None:
+                self._tail = TelemetryTail(self)
+            return self._tail
+
+
+def _open_log(path):
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def _read_lines(f, offset, records):
+    """Parse the complete lines of `f` after byte `offset` into `records`; returns the offset reached."""
+    f.seek(offset)
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        offset += len(line)
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return offset
+
+
+class TelemetryTail:
+    """
+    Reads the lines appended to a TelemetryStore once for all of its consumers.
+
+    Each consumer's consume(records, restarted) receives every batch of new
+    records; `restarted` means it must drop what it has. poll() starts a read
+    on a background thread at most every `refresh` seconds, so callers never
+    wait for the log to be parsed, even the first time.
+    """
+
+    def __init__(self, telemetry, refresh=DEFAULT_REFRESH):
+        self.telemetry = telemetry
+        self.refresh = refresh
+        self._consumers = []
+        self._position = None
+        self._generation = 0
+        self._polled_at = None
+        self._reading = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def add(self, consumer):
+        """Register `consumer`; the log is then read again from the start so it sees all of it."""
+        with self._lock:
+            self._consumers.append(consumer)
+            self._position = None
+            self._generation += 1
+            self._polled_at = None
+
+    def poll(self, force=False):
+        """
+        Start reading new records unless one is running or the last read is recent.
+
+        `force` skips the `refresh` wait. Returns an Event set when the read
+        in progress, or the last one, has been delivered.
+        """
+        with self._lock:
+            if self._reading or (not force and self._polled_at is not None
+                                 and time.time() - self._polled_at < self.refresh):
+                return self._done
+            self._reading = True
+            self._polled_at = time.time()
+            self._done = done = threading.Event()
+            position, generation, consumers = self._position, self._generation, list(self._consumers)
+        threading.Thread(target=self._read, args=(position, generation, consumers, done),
+                         name="kc-telemetry", daemon=True).start()
+        return done
+
+    def _read(self, position, generation, consumers, done):
+        next_position = position
+        try:
+            records, next_position, restarted = self.telemetry.read_new(position)
+            # Reading from the start replaces whatever consumers already hold
+            for consumer in consumers:
+                consumer.consume(records, restarted or position is None)
+        finally:
+            with self._lock:
+                self._reading = False
+                stale = generation != self._generation
+                if stale:
+                    self._polled_at = None
+                else:
+                    self._position = next_position
+            done.set()
+            if stale:
+                # A consumer was added meanwhile; read everything again for it
+                self.poll()
+
+
+class RollingWindow:
+    """
+    Per-key samples from the last `window` seconds of a TelemetryStore.
+
+    `extract(record)` returns (key, value) for records worth keeping, or
+    None. As the store's TelemetryTail delivers new records, {key: [values]}
+    is passed to `summarize`, at most every SUMMARY_INTERVAL seconds; get()
+    returns the latest summary without waiting for the log to be read.
+    """
+
+    def __init__(self, telemetry, extract, summarize, window):
+        self.extract = extract
+        self.summarize = summarize
+        self.window = window
+        self._samples = {}
+        self._summary = summarize({})
+        self._changed = False
+        self._summarized_at = 0
+        self._tail = telemetry.tail()
+        self._tail.add(self)
+
+    def get(self):
+        self._tail.poll()
+        return self._summary
+
+    def consume(self, records, restarted):
+        if restarted:
+            self._samples = {}
+            self._changed = True
+        for record in records:
+            sample = self.extract(record)
+            if sample is not None:
+                key, value = sample
+                self._samples.setdefault(key, deque()).append((record.get("ts", 0), value))
+                self._changed = True
+        cutoff = time.time() - self.window
+        for key in list(self._samples):
+            samples = self._samples[key]
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+                self._changed = True
+            if not samples:
+                del self._samples[key]
+        if self._changed and (restarted or time.time() - self._summarized_at >= SUMMARY_INTERVAL):
+            self._changed = False
+            self._summarized_at = time.time()
+            self._summary = self.summarize({key: [v for _, v in samples] for key, samples in self._samples.items()})
+
+
+class CallStats:
+    """
+    Counts and latency samples for a group of calls; `merge` combines groups.
+
+    At most MAX_SAMPLES successful calls are sampled for percentiles.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.retries = 0
+        self.ok = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        # (latency, ttfb, tokens/sec) of sampled successful calls
+        self.samples = []
+
+    def add(self, record):
+        self.calls += 1
+        self.retries += max(0, (record.get("attempts") or 1) - 1)
+        if record.get("status") == "cancelled":
+            self.cancelled += 1
+            return
+        latency = record.get("latency")
+        if record.get("status_code") != 200 or not latency:
+            self.errors += 1
+            return
+        self.ok += 1
+        self.prompt_tokens += record.get("prompt_tokens") or 0
+        self.cached_tokens += record.get("cached_tokens") or 0
+        self.completion_tokens += record.get("completion_tokens") or 0
+        completion_tokens = record.get("completion_tokens")
+        sample = (latency, record.get("ttfb"), completion_tokens / latency if completion_tokens else None)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(sample)
+        else:
+            slot = random.randrange(self.ok)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = sample
+
+    def merge(self, other):
+        for field in ("calls", "errors", "cancelled", "retries", "ok", "prompt_tokens", "cached_tokens",
+                      "completion_tokens"):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.samples.extend(other.samples)
+        return self
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def row(self):
+        latencies = [s[0] for s in self.samples]
+        ttfbs = [s[1] for s in self.samples if s[1] is not None]
+        rates = [s[2] for s in self.samples if s[2] is not None]
+        return {
+            "Calls": self.calls,
+            "Errors": self.errors,
+            "Cancelled": self.cancelled,
+            "p50 (s)": rounded(percentile(latencies, 50)),
+            "p95 (s)": rounded(percentile(latencies, 95)),
+            "p99 (s)": rounded(percentile(latencies, 99)),
+            "TTFB p50 (s)": rounded(percentile(ttfbs, 50)),
+            "Tokens/s p50": rounded(percentile(rates, 50), 1),
+            "Cached input %": rounded(100 * self.cached_tokens / self.prompt_tokens, 1)
+            if self.prompt_tokens else None,
+            "Retries": self.retries,
+        }
+
+
+def summary_rows(groups, by):
+    """Table rows for {group key tuple: CallStats}, labelled with the `by` fields."""
+    rows = []
+    for key, stats in sorted(groups.items()):
+        row = dict(zip((field.replace("_", " ").title() for field in by), key))
+        row.update(stats.row())
+        rows.append(row)
+    return rows
+
+
+def summarize(records, by=("model", "category")):
+    """
+    Aggregate call records into one row per group.
+
+    Latency percentiles only count successful calls; tokens/sec is completion
+    tokens divided by total latency. Cancelled calls are not errors.
+    """
+    groups = {}
+    for record in records:
+        key = tuple(record.get(field) or "—" for field in by)
+        groups.setdefault(key, CallStats()).add(record)
+    return summary_rows(groups, by)
+
+
+class CallSummary:
+    """
+    Incrementally maintained CallStats per model and category in `bucket`-second slices.
+
+    Fed by the store's TelemetryTail, so the dashboard never parses the log
+    itself; time windows are rounded to whole buckets. Slices older than
+    `retention` seconds are dropped. Safe to share between threads.
+    """
+
+    def __init__(self, telemetry, bucket=DEFAULT_BUCKET, retention=DEFAULT_RETENTION):
+        self.bucket = bucket
+        self.retention = retention
+        self._loaded = threading.Event()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._tail = telemetry.tail()
+        self._tail.add(self)
+
+    def consume(self, records, restarted):
+        if restarted:
+            # A full read is built aside, so readers keep the old totals until it is done
+            buckets = {}
+            self._add(buckets, records)
+            with self._lock:
+                self._buckets = buckets
+        else:
+            with self._lock:
+                self._add(self._buckets, records)
+        with self._lock:
+            cutoff = time.time() - self.retention
+            for key in [key for key in self._buckets if key[0] < cutoff]:
+                del self._buckets[key]
+        self._loaded.set()
+
+    def _add(self, buckets, records):
+        for record in records:
+            start = record.get("ts", 0) // self.bucket * self.bucket
+            key = (start, record.get("model") or "—", record.get("category") or "—")
+            stats = buckets.get(key)
+            if stats is None:
+                stats = buckets[key] = CallStats()
+            stats.add(record)
+
+    @property
+    def loaded(self):
+        return self._loaded.is_set()
+
+    def poll(self, timeout=0):
+        """Read new records, waiting up to `timeout` seconds for them; True once the log has been read."""
+        self._tail.poll(force=timeout > 0).wait(timeout)
+        return self.loaded
+
+    def _groups(self, since, by):
+        groups = {}
+        fields = {"model": 1, "category": 2}
+        with self._lock:
+            for key, stats in self._buckets.items():
+                if since is not None and key[0] + self.bucket <= since:
+                    continue
+                group = tuple(key[fields[field]] for field in by)
+                groups.setdefault(group, CallStats()).merge(stats)
+        return groups
+
+    def total(self, since=None):
+        """CallStats of every call newer than `since`."""
+        total = CallStats()
+        for stats in self._groups(since, ()).values():
+            total.merge(stats)
+        return total
+
+    def rows(self, since=None, by=("model", "category")):
+        return summary_rows(self._groups(since, by), by)
+
+
+def rounded(value, digits=2):
+    return None if value is None else round(value, digits)
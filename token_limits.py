@@ -0,0 +1,104 @@
+"""
+Adaptive max_tokens
+Learns how long answers really are for each (category, model) from the
+completion-token counts in telemetry, and requests a high percentile of that
+plus headroom instead of a flat 2048. Answers cut off with
+finish_reason == "length" are retried with a larger limit.
+"""
+
+import math
+import os
+
+from openrouter import DEFAULT_MAX_TOKENS
+from telemetry import RollingWindow, percentile, rounded
+
+DEFAULT_PERCENTILE = float(os.getenv("KC_MAX_TOKENS_PERCENTILE", 99))
+DEFAULT_HEADROOM = float(os.getenv("KC_MAX_TOKENS_HEADROOM", 1.25))
+# Below this many observed answers the fixed default is used
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_FLOOR = 256
+# Truncated answers are retried up to this limit
+DEFAULT_CEILING = 4096
+# Only answers from this window count, so the limit follows prompt edits
+DEFAULT_WINDOW = 14 * 24 * 3600
+
+
+class AdaptiveLimits:
+    """
+    Per-(category, model) max_tokens learned from a TelemetryStore.
+
+    Statistics follow the store's shared TelemetryTail in the background;
+    until the log has been read the fixed default is used. Safe to share
+    between threads.
+    """
+
+    def __init__(self, telemetry, percentile=DEFAULT_PERCENTILE, headroom=DEFAULT_HEADROOM,
+                 min_samples=DEFAULT_MIN_SAMPLES, floor=DEFAULT_FLOOR, ceiling=DEFAULT_CEILING,
+                 default=DEFAULT_MAX_TOKENS, window=DEFAULT_WINDOW):
+        self.telemetry = telemetry
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.floor = floor
+        self.ceiling = ceiling
+        self.default = default
+        self.window = window
+        self._window = RollingWindow(telemetry, self._extract, self._summarize, window)
+
+    @staticmethod
+    def _extract(record):
+        if record.get("status_code") != 200 or not record.get("completion_tokens"):
+            return None
+        return (record.get("category"), record.get("model")), (
+            record["completion_tokens"], record.get("finish_reason") == "length")
+
+    def _summarize(self, samples):
+        stats = {}
+        for key, answers in samples.items():
+            tokens = [n for n, truncated in answers if not truncated]
+            group = {"tokens": tokens, "calls": len(answers), "truncated": len(answers) - len(tokens),
+                     "limit": self.default}
+            if len(tokens) >= self.min_samples:
+                learned = math.ceil(percentile(tokens, self.percentile) * self.headroom)
+                group["limit"] = max(self.floor, min(self.ceiling, learned))
+            stats[key] = group
+        return stats
+
+    def stats(self):
+        """{(category, model): {"tokens": [...], "calls": n, "truncated": n, "limit": n}} from recent telemetry."""
+        return self._window.get()
+
+    def limit(self, category, model):
+        """max_tokens to request for this category and model."""
+        group = self.stats().get((category, model))
+        return self.default if group is None else group["limit"]
+
+    def next_limit(self, limit):
+        """Larger limit for retrying a truncated answer."""
+        return min(self.ceiling, max(limit * 2, limit + self.floor))
+
+    def run(self, send, category, model):
+        """
+        Call `send(max_tokens)` with the learned limit, retrying with larger
+        limits while the answer comes back truncated. Returns the last Completion.
+        """
+        limit = self.limit(category, model)
+        while True:
+            completion = send(limit)
+            if completion.finish_reason != "length" or limit >= self.ceiling:
+                return completion
+            limit = self.next_limit(limit)
+
+    def rows(self):
+        """One row per category and model for display."""
+        rows = []
+        for (category, model), group in sorted(self.stats().items(), key=lambda item: str(item[0])):
+            rows.append({
+                "Category": category or "—",
+                "Model": model,
+                "Answers": group["calls"],
+                f"p{self.percentile:g} tokens": rounded(percentile(group["tokens"], self.percentile), 0),
+                "max_tokens": group["limit"],
+                "Truncated %": rounded(100 * group["truncated"] / group["calls"], 1),
+            })
+        return rows